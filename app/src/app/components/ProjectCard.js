@@ -79,7 +79,16 @@ export default function ProjectCard({ project, onClick, onRename, onDelete }) {
         justifyContent: "center",
         borderBottom: "1px solid #444"
       }}>
-        <div style={{ color: "#76ABAE", opacity: 0.3, fontSize: "40px" }}>⚛</div>
+        {project.thumbnail?.length > 0 ? (
+          // Cells of a 24x16 grid holding at least one node
+          <svg viewBox="-1 -1 26 18" style={{ width: "100%", height: "100%", padding: "12px" }}>
+            {project.thumbnail.map(([column, row]) => (
+              <rect key={`${column}-${row}`} x={column} y={row} width="0.8" height="0.8" fill="#76ABAE" />
+            ))}
+          </svg>
+        ) : (
+          <div style={{ color: "#76ABAE", opacity: 0.3, fontSize: "40px" }}>⚛</div>
+        )}
       </div>
 
 
@@ -90,6 +99,9 @@ export default function ProjectCard({ project, onClick, onRename, onDelete }) {
         <div style={{ color: "#76ABAE", fontSize: "10px", marginTop: "4px" }}>
           LAST EDITED: {project.lastModified}
         </div>
+        <div style={{ color: "#EEEEEE", opacity: 0.5, fontSize: "10px", marginTop: "2px" }}>
+          {project.node_count ?? 0} NODES / {project.edge_count ?? 0} EDGES
+        </div>
       </div>
     </div>
   )
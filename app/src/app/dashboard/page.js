@@ -14,9 +14,25 @@ export default function Dashboard() {
   const { data: session, status } = useSession()
   const router = useRouter()
   const [projects, setProjects] = useState([])
+  const [nextCursor, setNextCursor] = useState(null)
   const [loading, setLoading] = useState(true)
   const { showInputModal, showConfirm, showSuccess, showError } = useModal()
 
+  // Project summaries, a page at a time. Without a cursor the list starts over.
+  const loadProjects = async (cursor = null) => {
+    const response = await api.get("/projects/list", { params: { cursor, limit: 50 } })
+    setProjects(prev => cursor ? [...prev, ...response.data.projects] : response.data.projects)
+    setNextCursor(response.data.cursor)
+  }
+
+  const loadMoreProjects = async () => {
+    try {
+      await loadProjects(nextCursor)
+    } catch (error) {
+      console.error("FAILED TO FETCH PROJECTS:", error)
+    }
+  }
+
   useEffect(() => {
     if (status === "unauthenticated") {
       router.push("/login")
@@ -27,8 +43,7 @@ export default function Dashboard() {
       if (status === "authenticated") {
         try {
           setLoading(true)
-          const response = await api.get("/projects/my-projects")
-          setProjects(response.data)
+          await loadProjects()
         } catch (error) {
           console.error("FAILED TO FETCH PROJECTS:", error)
         } finally {
@@ -67,8 +82,7 @@ export default function Dashboard() {
 
           if (response.status === 200 || response.status === 201) {
             // Refresh projects list after creation
-            const projectsResponse = await api.get("/projects/my-projects")
-            setProjects(projectsResponse.data)
+            await loadProjects()
             showSuccess("Project created successfully!")
             // Navigate to the newly created project
             router.push(`/canvas?id=${response.data.id}`)
@@ -102,8 +116,7 @@ export default function Dashboard() {
 
           if (response.status === 200) {
             // Refresh projects list
-            const projectsResponse = await api.get("/projects/my-projects")
-            setProjects(projectsResponse.data)
+            await loadProjects()
             showSuccess("Project renamed successfully!")
           }
         } catch (error) {
@@ -124,8 +137,7 @@ export default function Dashboard() {
 
           if (response.status === 200) {
             // Refresh projects list
-            const projectsResponse = await api.get("/projects/my-projects")
-            setProjects(projectsResponse.data)
+            await loadProjects()
             showSuccess("Project deleted successfully!")
           }
         } catch (error) {
@@ -191,6 +203,18 @@ export default function Dashboard() {
                 onDelete={handleDeleteProject}
               />
             ))}
+            {nextCursor && (
+              <button
+                onClick={loadMoreProjects}
+                style={{
+                  gridColumn: "1/-1", backgroundColor: "transparent", color: "#76ABAE",
+                  border: "1px solid #76ABAE", padding: "10px", borderRadius: "4px",
+                  cursor: "pointer", fontFamily: "monospace"
+                }}
+              >
+                LOAD MORE
+              </button>
+            )}
             {projects.length === 0 && !loading && (
               <div style={{ color: "#444", gridColumn: "1/-1", textAlign: "center", marginTop: "50px", fontFamily: "monospace" }}>
                 [!] NO DATA FRAGMENTS FOUND. START A NEW SESSION.
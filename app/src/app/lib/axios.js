@@ -22,4 +22,21 @@ api.interceptors.request.use(
   }
 )
 
+// Request bodies above this size are gzipped before upload
+const COMPRESS_MIN_SIZE = 64 * 1024
+
+// JSON request body, gzipped when large and the browser can compress streams
+export const encodeBody = async (value) => {
+  const json = JSON.stringify(value)
+  if (json.length < COMPRESS_MIN_SIZE || typeof CompressionStream === 'undefined') {
+    return { data: json, headers: {} }
+  }
+
+  const stream = new Blob([json]).stream().pipeThrough(new CompressionStream('gzip'))
+  return {
+    data: await new Response(stream).arrayBuffer(),
+    headers: { 'Content-Encoding': 'gzip' },
+  }
+}
+
 export default api
\ No newline at end of file
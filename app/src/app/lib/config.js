@@ -1,6 +1,8 @@
 export const API_CONFIG = {
   baseURL: process.env.NEXT_PUBLIC_API_URL || 'http://127.0.0.1:8000/v1',
   pollInterval: 2000,
+  // Seconds the API holds a result request open until something changes
+  pollWait: 25,
 }
 
 export const TASK_STATUS = {
@@ -10,6 +12,7 @@ export const TASK_STATUS = {
   FAILURE: 'FAILURE',
   RETRY: 'RETRY',
   REVOKED: 'REVOKED',
+  CANCELLED: 'CANCELLED',
 }
 
 export const UI_TASK_STATUS = {
@@ -1,6 +1,6 @@
 import { useState, useCallback, useEffect, useRef } from "react"
 import { applyEdgeChanges, applyNodeChanges } from "reactflow"
-import api from "@/app/lib/axios"
+import api, { encodeBody } from "@/app/lib/axios"
 import { useModal } from "@/app/context/ModalContext"
 import {
   TASK_STATUS,
@@ -58,6 +58,46 @@ const calculateDynamicPosition = (nodes, nodeType, toolId = null) => {
   }
 }
 
+// Most operations the API takes in one patch (ProjectPatchSchema)
+const MAX_PATCH_OPERATIONS = 5000
+
+// Index canvas elements by id, to diff them against the next save
+const indexCanvas = (items) => new Map(items.map(item => [item.id, item]))
+
+// Patch operations turning the saved elements into the current ones
+const diffCanvas = (target, saved, items) => {
+  const operations = []
+  const seen = new Set()
+
+  items.forEach(item => {
+    seen.add(item.id)
+    const before = saved.get(item.id)
+    if (!before) {
+      operations.push({ op: "add", target, id: item.id, value: item })
+      return
+    }
+
+    const value = {}
+    Object.keys({ ...before, ...item }).forEach(key => {
+      if (JSON.stringify(before[key]) !== JSON.stringify(item[key])) {
+        value[key] = item[key] ?? null
+      }
+    })
+
+    const keys = Object.keys(value)
+    if (keys.length === 1 && keys[0] === "position") {
+      operations.push({ op: "move", target, id: item.id, position: value.position })
+    } else if (keys.length > 0) {
+      operations.push({ op: "update", target, id: item.id, value })
+    }
+  })
+
+  saved.forEach((_, id) => {
+    if (!seen.has(id)) operations.push({ op: "remove", target, id })
+  })
+  return operations
+}
+
 export const useMotegaoController = (projectId) => {
   const { showError, showInfo } = useModal()
   // State management
@@ -74,6 +114,12 @@ export const useMotegaoController = (projectId) => {
   
   // Ref to track running tasks for cleanup without triggering re-renders
   const runningTasksRef = useRef({})
+  // Version of the last task results received, the API holds polls until it changes
+  const pollEtagRef = useRef(null)
+  // Canvas as of the last save and its revision, later saves only send the changes
+  const savedCanvasRef = useRef(null)
+  // Revision the canvas was loaded at, the first save only applies on top of it
+  const loadedRevisionRef = useRef(null)
 
   // Graph handlers
   const onNodesChange = useCallback(
@@ -148,20 +194,67 @@ export const useMotegaoController = (projectId) => {
         return cleanNode;
       });
       
-      await api.put(`/projects/update/${projectId}`, {
-        nodes: cleanNodes,
-        edges: currentEdges,
-        lastModified: new Date().toISOString()
-      });
+      const saved = savedCanvasRef.current;
+      let revision = null;
+      if (saved) {
+        const operations = [
+          ...diffCanvas("node", saved.nodes, cleanNodes),
+          ...diffCanvas("edge", saved.edges, currentEdges)
+        ];
+        if (operations.length <= MAX_PATCH_OPERATIONS) {
+          try {
+            const { data, headers } = await encodeBody({ revision: saved.revision, operations });
+            const response = await api.patch(`/projects/update/${projectId}`, data, { headers });
+            revision = response.data.revision;
+          } catch (error) {
+            // Stale (409) or refused (422) patches fall back to a full save
+            if (![409, 422].includes(error.response?.status)) throw error;
+          }
+        }
+        if (revision === null) {
+          // Guarded on the last saved revision, so it cannot overwrite other saves
+          savedCanvasRef.current = null;
+          loadedRevisionRef.current = saved.revision;
+        }
+      }
+      if (revision === null) {
+        const { data, headers } = await encodeBody({
+          nodes: cleanNodes,
+          edges: currentEdges,
+          lastModified: new Date().toISOString()
+        });
+        // Refused with 412 if the project was saved elsewhere since it was loaded
+        if (loadedRevisionRef.current !== null) {
+          headers["If-Match"] = `"r${loadedRevisionRef.current}"`;
+        }
+        const response = await api.put(`/projects/update/${projectId}`, data, { headers });
+        revision = response.data.revision;
+      }
+
+      savedCanvasRef.current = {
+        revision,
+        nodes: indexCanvas(cleanNodes),
+        edges: indexCanvas(currentEdges)
+      };
       console.log("DATABASE_SYNCHRONIZED");
       setSaveStatus("saved");
     } catch (error) {
       console.error("AUTO_SAVE_ERROR:", error);
       setSaveStatus("unsaved");
-      showError("Failed to save project");
+      if ([409, 412].includes(error.response?.status)) {
+        showError("Project was changed elsewhere, reload it to keep editing", "Save Conflict");
+      } else {
+        showError("Failed to save project");
+      }
     }
   }, [projectId, showError]);
 
+  // A new project starts over with a full save
+  useEffect(() => {
+    savedCanvasRef.current = null
+    loadedRevisionRef.current = null
+  }, [projectId]);
+
   // Handle clicking on a subdomain to add it as a new domain node
   const handleSubdomainClick = useCallback((subdomain, sourceNodeId) => {
     // Check if this subdomain already exists as a domain
@@ -228,10 +321,11 @@ export const useMotegaoController = (projectId) => {
 
       try {
         // Use authenticated endpoint
-        const response = await api.get(`/projects/detail/${projectId}`);
+        const response = await api.get(`/projects/graph/${projectId}`);
         if (response.data) {
           // ถ้ามีข้อมูลใน DB ให้เอามาทับ Mock data
           const { nodes: savedNodes, edges: savedEdges } = response.data;
+          loadedRevisionRef.current = response.data.revision ?? null;
           
           if (savedNodes) {
             // Clean loaded nodes - ensure labels are strings not React objects
@@ -456,43 +550,74 @@ export const useMotegaoController = (projectId) => {
 
     if (activeTasks.length === 0) return
 
-    const interval = setInterval(async () => {
-      for (const [toolId, task] of activeTasks) {
+    const controller = new AbortController()
+
+    const poll = async () => {
+      while (!controller.signal.aborted) {
+        let statuses
         try {
-          const response = await api.get(`/commands/${task.taskId}/result`)
-          const { status, result } = response.data
-
-          if (status == "PROGRESS") {
-            setRunningTasks(prev => ({
-              ...prev,
-              [toolId]: { ...prev[toolId], status: UI_TASK_STATUS.RUNNING, progress: (result && result.progress) || 0 }
-            }))
-          } else if (status === TASK_STATUS.SUCCESS) {
-            setRunningTasks(prev => ({
-              ...prev,
-              [toolId]: { ...prev[toolId], status: UI_TASK_STATUS.COMPLETED, result }
-            }))
-
-            updateNodesWithResults(toolId, result)
-          } else if (status === TASK_STATUS.REVOKED) {
-            setRunningTasks(prev => ({
-              ...prev,
-              [toolId]: { ...prev[toolId], status: UI_TASK_STATUS.FAILED, error: result }
-            }))
-            showError('Worker Task Revoked', `The worker task for ${toolId} was revoked. This usually means the worker failed or was terminated. Please try again.`)
-          } else if (status === TASK_STATUS.FAILURE) {
-            setRunningTasks(prev => ({
-              ...prev,
-              [toolId]: { ...prev[toolId], status: UI_TASK_STATUS.FAILED, error: result }
-            }))
-          }
+          // One long-poll for every running task, without the (large) findings
+          const response = await api.post('/commands/results', {
+            task_ids: activeTasks.map(([_, task]) => task.taskId),
+            fields: ['progress', 'error'],
+            wait: API_CONFIG.pollWait,
+            etag: pollEtagRef.current
+          }, {
+            signal: controller.signal,
+            validateStatus: status => status === 200 || status === 304
+          })
+          if (response.status === 304) continue
+
+          statuses = response.data.results
+          pollEtagRef.current = response.data.etag
         } catch (error) {
-          console.error(`Error polling task ${task.taskId}:`, error)
+          if (controller.signal.aborted) return
+          console.error('Error polling tasks:', error)
+          await new Promise(resolve => setTimeout(resolve, API_CONFIG.pollInterval))
+          continue
+        }
+
+        for (const [toolId, task] of activeTasks) {
+          try {
+            let { status, result } = statuses[task.taskId]
+
+            if (status == "PROGRESS") {
+              setRunningTasks(prev => ({
+                ...prev,
+                [toolId]: { ...prev[toolId], status: UI_TASK_STATUS.RUNNING, progress: (result && result.progress) || 0 }
+              }))
+            } else if (status === TASK_STATUS.SUCCESS || status === TASK_STATUS.CANCELLED) {
+              // Fetch the full result only once the task is done, cancelled
+              // tasks keep what they found before stopping
+              result = (await api.get(`/commands/${task.taskId}/result`)).data.result
+              setRunningTasks(prev => ({
+                ...prev,
+                [toolId]: { ...prev[toolId], status: UI_TASK_STATUS.COMPLETED, result }
+              }))
+
+              updateNodesWithResults(toolId, result)
+            } else if (status === TASK_STATUS.REVOKED) {
+              setRunningTasks(prev => ({
+                ...prev,
+                [toolId]: { ...prev[toolId], status: UI_TASK_STATUS.FAILED, error: result }
+              }))
+              showError('Worker Task Revoked', `The worker task for ${toolId} was revoked. This usually means the worker failed or was terminated. Please try again.`)
+            } else if (status === TASK_STATUS.FAILURE) {
+              setRunningTasks(prev => ({
+                ...prev,
+                [toolId]: { ...prev[toolId], status: UI_TASK_STATUS.FAILED, error: result }
+              }))
+            }
+          } catch (error) {
+            console.error(`Error polling task ${task.taskId}:`, error)
+          }
         }
       }
-    }, API_CONFIG.pollInterval)
+    }
+
+    poll()
 
-    return () => clearInterval(interval)
+    return () => controller.abort()
   }, [runningTasks])
 
   // Keep ref in sync with state
@@ -544,7 +669,7 @@ export const useMotegaoController = (projectId) => {
     let newEdge = null
 
     if (toolId === TOOL_IDS.NMAP) {
-      const isError = result.includes("Usage: nmap")
+      const isError = typeof result === 'string' ? result.includes("Usage: nmap") : Boolean(result?.error)
       const nodeId = `nmap-${Date.now()}`
 
       if (isError) {
@@ -567,12 +692,20 @@ export const useMotegaoController = (projectId) => {
         }
       } else {
         const openPorts = []
-        const lines = result.split('\n')
-        lines.forEach(line => {
-          if (line.includes('open')) {
-            openPorts.push(line.trim())
-          }
-        })
+        if (typeof result === 'string') {
+          result.split('\n').forEach(line => {
+            if (line.includes('open')) {
+              openPorts.push(line.trim())
+            }
+          })
+        } else {
+          (result.hosts || []).forEach(host => {
+            host.ports.filter(port => port.state === 'open').forEach(port => {
+              const service = [port.service.name, port.service.product, port.service.version].filter(Boolean).join(' ')
+              openPorts.push(`${host.address} ${port.port}/${port.protocol} ${service}`.trim())
+            })
+          })
+        }
 
         newNode = {
           id: nodeId,
@@ -892,10 +1025,15 @@ export const useMotegaoController = (projectId) => {
     }
 
     try {
-      // Cancel the task and get any partial results
+      // Running tasks stop on their own and report their partial results
+      // as CANCELLED, polling picks those up
       const response = await api.get(`/commands/${task.taskId}/cancel`)
       const { status, result } = response.data
-      
+      if (status === 'CANCELLING') {
+        showInfo("Stopping task, partial results will be kept.", "Task Cancelled")
+        return
+      }
+
       // If we have partial results, update the graph with them
       if (result && (result.subdomains?.length > 0 || result.paths?.length > 0 || result)) {
         if (toolId === TOOL_IDS.SUBDOMAIN || toolId === TOOL_IDS.PATHFINDER) {
@@ -950,7 +1088,8 @@ export const useMotegaoController = (projectId) => {
           response = await api.post("/commands/subdomain_dns_enum", {
             domain: selectedDomain.name,
             threads: config.threads || 1,
-            wordlist: wordlistMap[config.wordlist] || 1
+            wordlist: wordlistMap[config.wordlist] || 1,
+            project_id: projectId
           })
           break
 
@@ -958,7 +1097,8 @@ export const useMotegaoController = (projectId) => {
           let nmapPayload = {
             host: selectedDomain.name,
             timing_template: config.timing_template || 3,
-            options: ["-sV"]
+            options: ["-sV"],
+            project_id: projectId
           }
           
           // Handle all ports flag - backend uses defaults when all_ports is not set
@@ -983,7 +1123,8 @@ export const useMotegaoController = (projectId) => {
           const pathfinderPayload = {
             url: `${protocol}://${selectedDomain.name}`,
             threads: config.threads || 1,
-            wordlist: pathfinderWordlistMap[config.wordlist] || 1
+            wordlist: pathfinderWordlistMap[config.wordlist] || 1,
+            project_id: projectId
           }
           
           // Add exclude_status if provided
@@ -1022,7 +1163,7 @@ export const useMotegaoController = (projectId) => {
         "Execution Failed"
       )
     }
-  }, [selectedDomain, showError, showInfo])
+  }, [selectedDomain, showError, showInfo, projectId])
 
   // Manual save project
   const handleSaveProject = useCallback(async () => {
@@ -14,6 +14,7 @@ from motegao.api.routers import init_router
 
 from motegao.api.core.config import get_app_settings
 from motegao.api.core.caching import init_redis_cache
+from motegao.api.core.canvas import convert_dates
 from motegao import models
 
 
@@ -51,5 +52,9 @@ async def lifespan(app: FastAPI):
 
     init_redis_cache(settings)
     await models.init_beanie(app, settings)
+    # Older saves stored lastModified as a string, listings page on dates
+    converted = await convert_dates()
+    if converted:
+        logger.info(f"Converted lastModified of {converted} projects to dates")
     await init_router(app, settings)
     yield
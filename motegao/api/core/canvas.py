@@ -0,0 +1,354 @@
+from fastapi import HTTPException
+from pymongo import DeleteMany, ReplaceOne, UpdateOne
+
+from motegao.models.projects import CanvasEdge, CanvasNode, Project
+
+EMBEDDED = "embedded"
+SPLIT = "split"
+
+CANVAS_FIELDS = {"node": "nodes", "edge": "edges"}
+# Grid the node positions are reduced to for dashboard previews
+THUMBNAIL_COLUMNS = 24
+THUMBNAIL_ROWS = 16
+# Canvas array -> collection of the split storage and its element id key
+DOCUMENTS = {"nodes": (CanvasNode, "node_id"), "edges": (CanvasEdge, "edge_id")}
+
+
+def revision_guard(revision: int):
+    # Documents saved before revisions existed have none
+    return revision or {"$in": [0, None]}
+
+
+def element_document(project_id, field: str, element: dict) -> dict:
+    document = {"project": project_id, "data": element}
+    if field == "nodes":
+        position = element.get("position") or {}
+        document.update(
+            node_id=element["id"],
+            type=element.get("type"),
+            x=position.get("x", 0),
+            y=position.get("y", 0),
+        )
+    else:
+        document.update(
+            edge_id=element["id"],
+            source=element.get("source"),
+            target=element.get("target"),
+        )
+    return document
+
+
+def thumbnail(nodes: list) -> list:
+    """Returns the `[column, row]` cells of the preview grid holding a node."""
+
+    points = []
+    for node in nodes:
+        position = node.get("position") or {}
+        points.append((position.get("x", 0), position.get("y", 0)))
+    if not points:
+        return []
+
+    xs, ys = zip(*points)
+    width, height = (max(xs) - min(xs)) or 1, (max(ys) - min(ys)) or 1
+    cells = {
+        (
+            int((x - min(xs)) / width * (THUMBNAIL_COLUMNS - 1)),
+            int((y - min(ys)) / height * (THUMBNAIL_ROWS - 1)),
+        )
+        for x, y in points
+    }
+    return [list(cell) for cell in sorted(cells)]
+
+
+def summary_fields(nodes: list, edges: list) -> dict:
+    nodes, edges = nodes or [], edges or []
+    return {
+        "node_count": len(nodes),
+        "edge_count": len(edges),
+        "thumbnail": thumbnail(nodes),
+    }
+
+
+def count_update(project: dict, changes: dict) -> dict:
+    """Returns the update keeping the element counts right after `changes`."""
+
+    update = {}
+    for field, (pulls, _, _, pushes) in changes.items():
+        name = f"{field[:-1]}_count"
+        delta = len(pushes) - len(pulls)
+        if project.get("storage") == SPLIT:
+            update.setdefault("$inc", {})[name] = delta
+        else:
+            # Embedded projects saved before the counts existed have none
+            count = len(project.get(field) or []) + delta
+            update.setdefault("$set", {})[name] = count
+    return update
+
+
+def indexed_fields(field: str, key: str, value) -> dict:
+    """Returns the indexed copies to update along with an element's `key`."""
+
+    if field == "nodes" and key == "position":
+        position = value or {}
+        return {"x": position.get("x", 0), "y": position.get("y", 0)}
+    if (field, key) in (("nodes", "type"), ("edges", "source"), ("edges", "target")):
+        return {key: value}
+    return {}
+
+
+def fold_operations(operations, existing: dict) -> dict:
+    """Folds patch operations into the net changes of each canvas array.
+
+    Returns `field: (pulls, sets, replaces, pushes)` keyed by element id.
+    `existing` holds the ids already stored per array. Operations apply in
+    order, so edits to an element added by the same patch end up in the
+    pushed element and removing it cancels the push.
+    """
+
+    changes = {}
+    for operation in operations:
+        field = CANVAS_FIELDS[operation.target]
+        pulls, sets, replaces, pushes = changes.setdefault(field, (set(), {}, {}, {}))
+        item_id = operation.id
+        stored = item_id in existing[field] and item_id not in pulls
+
+        if operation.op == "remove":
+            sets.pop(item_id, None)
+            replaces.pop(item_id, None)
+            pushes.pop(item_id, None)
+            if item_id in existing[field]:
+                pulls.add(item_id)
+        elif operation.op == "add":
+            element = {**operation.value, "id": item_id}
+            if stored:
+                sets.pop(item_id, None)
+                replaces[item_id] = element
+            else:
+                pushes[item_id] = element
+        else:
+            value = operation.value
+            if operation.op == "move":
+                value = {"position": operation.position}
+            value = {key: item for key, item in value.items() if key != "id"}
+
+            if item_id in pushes or item_id in replaces:
+                (pushes if item_id in pushes else replaces)[item_id].update(value)
+            elif stored:
+                sets.setdefault(item_id, {}).update(value)
+            else:
+                raise HTTPException(
+                    status_code=422,
+                    detail=f"No {operation.target} {item_id} in project",
+                )
+
+    return changes
+
+
+def embedded_updates(changes: dict) -> list:
+    """Builds the `(update, array_filters)` statements applying folded changes.
+
+    MongoDB refuses to pull from, set in and push to one array in the same
+    update, so each array gets one statement per kind of change, in that
+    order. Statements for different arrays are combined.
+    """
+
+    statements = []
+    for field, (pulls, sets, replaces, pushes) in changes.items():
+        phases = []
+        if pulls:
+            phases.append(({"$pull": {field: {"id": {"$in": list(pulls)}}}}, []))
+        if sets or replaces:
+            update, filters = {}, []
+            for item_id in [*sets, *replaces]:
+                name = f"{field[0]}{len(filters)}"
+                filters.append({f"{name}.id": item_id})
+                if item_id in replaces:
+                    update[f"{field}.$[{name}]"] = replaces[item_id]
+                    continue
+                for key, value in sets[item_id].items():
+                    update[f"{field}.$[{name}].{key}"] = value
+            phases.append(({"$set": update}, filters))
+        if pushes:
+            phases.append(({"$push": {field: {"$each": list(pushes.values())}}}, []))
+
+        for index, (update, filters) in enumerate(phases):
+            if index == len(statements):
+                statements.append(({}, []))
+            for operator, fields in update.items():
+                statements[index][0].setdefault(operator, {}).update(fields)
+            statements[index][1].extend(filters)
+
+    return statements or [({}, [])]
+
+
+def split_writes(project_id, changes: dict) -> dict:
+    """Builds the bulk writes applying folded changes to the split collections."""
+
+    writes = {}
+    for field, (pulls, sets, replaces, pushes) in changes.items():
+        _, key = DOCUMENTS[field]
+        requests = []
+        if pulls:
+            pulled = {"project": project_id, key: {"$in": list(pulls)}}
+            requests.append(DeleteMany(pulled))
+        for item_id, fields in sets.items():
+            update = {}
+            for name, value in fields.items():
+                update[f"data.{name}"] = value
+                update.update(indexed_fields(field, name, value))
+            requests.append(
+                UpdateOne({"project": project_id, key: item_id}, {"$set": update})
+            )
+        for item_id, element in {**replaces, **pushes}.items():
+            requests.append(
+                ReplaceOne(
+                    {"project": project_id, key: item_id},
+                    element_document(project_id, field, element),
+                    upsert=True,
+                )
+            )
+        if requests:
+            writes[field] = requests
+    return writes
+
+
+async def run_writes(writes: dict):
+    for field, requests in writes.items():
+        model, _ = DOCUMENTS[field]
+        await model.get_pymongo_collection().bulk_write(requests, ordered=True)
+
+
+async def existing_ids(project: dict, operations) -> dict:
+    """Returns, per canvas array, the stored ids among those the operations touch.
+
+    Embedded projects are read with their element ids, split ones only
+    look up the ids of the patch.
+    """
+
+    if project.get("storage") != SPLIT:
+        return {
+            field: {item.get("id") for item in project.get(field) or []}
+            for field in CANVAS_FIELDS.values()
+        }
+
+    ids = {}
+    for target, field in CANVAS_FIELDS.items():
+        model, key = DOCUMENTS[field]
+        wanted = list({op.id for op in operations if op.target == target})
+        found = model.get_pymongo_collection().find(
+            {"project": project["_id"], key: {"$in": wanted}}, {key: 1}
+        )
+        ids[field] = {document[key] for document in await found.to_list()}
+    return ids
+
+
+async def replace_canvas(project_id, nodes: list, edges: list):
+    """Stores a whole canvas in the split collections, dropping other elements."""
+
+    for field, elements in (("nodes", nodes or []), ("edges", edges or [])):
+        _, key = DOCUMENTS[field]
+        ids = [element["id"] for element in elements]
+        requests = [DeleteMany({"project": project_id, key: {"$nin": ids}})]
+        requests += [
+            ReplaceOne(
+                {"project": project_id, key: element["id"]},
+                element_document(project_id, field, element),
+                upsert=True,
+            )
+            for element in elements
+        ]
+        await run_writes({field: requests})
+
+
+async def load_elements(
+    project_id, field: str, query: dict | None = None, cursor=None, limit=0
+) -> list:
+    """Returns split canvas elements in id order, `cursor` is the last id seen."""
+
+    model, key = DOCUMENTS[field]
+    query = {"project": project_id, **(query or {})}
+    if cursor:
+        query[key] = {"$gt": cursor}
+    found = model.get_pymongo_collection().find(query, {"data": 1}).sort(key, 1)
+    return [document["data"] for document in await found.limit(limit).to_list()]
+
+
+async def load_embedded_elements(
+    project_id, field: str, conditions: list | None = None, cursor=None, limit=0
+) -> list:
+    """Returns embedded canvas elements in id order, like `load_elements`.
+
+    `conditions` are expressions on `$$element`. The array is filtered, sorted
+    and sliced in the projection, only the page is read from the database.
+    """
+
+    conditions = list(conditions or [])
+    if cursor:
+        conditions.append({"$gt": ["$$element.id", cursor]})
+    elements = {
+        "$filter": {
+            "input": {"$ifNull": [f"${field}", []]},
+            "as": "element",
+            "cond": {"$and": conditions},
+        }
+    }
+    elements = {"$sortArray": {"input": elements, "sortBy": {"id": 1}}}
+    if limit:
+        elements = {"$slice": [elements, limit]}
+    project = await Project.get_pymongo_collection().find_one(
+        {"_id": project_id}, {"elements": elements}
+    )
+    return (project or {}).get("elements") or []
+
+
+async def delete_canvas(project_id):
+    for model, _ in DOCUMENTS.values():
+        await model.get_pymongo_collection().delete_many({"project": project_id})
+
+
+async def convert_dates() -> int:
+    """Turns the ISO string lastModified of older saves into dates.
+
+    Listings sort and page on lastModified, strings sort before every date
+    and never match a date cursor. Converted projects are not matched again.
+    """
+
+    parsed = {"$dateFromString": {"dateString": "$lastModified"}}
+    result = await Project.get_pymongo_collection().update_many(
+        {"lastModified": {"$type": "string"}}, [{"$set": {"lastModified": parsed}}]
+    )
+    return result.modified_count
+
+
+async def migrate_project(project_id) -> bool:
+    """Moves an embedded canvas to the split collections, returns if it is split.
+
+    Elements are upserted by id so a migration can be rerun. The project
+    only switches storage if no save came in meanwhile, and the switch bumps
+    the revision so patches made against the embedded canvas are refused.
+    """
+
+    collection = Project.get_pymongo_collection()
+    project = await collection.find_one(
+        {"_id": project_id}, {"storage": 1, "revision": 1, "nodes": 1, "edges": 1}
+    )
+    if not project:
+        return False
+    if project.get("storage") == SPLIT:
+        return True
+
+    nodes, edges = project.get("nodes"), project.get("edges")
+    await replace_canvas(project_id, nodes, edges)
+    result = await collection.update_one(
+        {
+            "_id": project_id,
+            "revision": revision_guard(project.get("revision", 0)),
+            "patching": None,
+        },
+        {
+            "$set": {"storage": SPLIT, **summary_fields(nodes, edges)},
+            "$unset": {"nodes": "", "edges": ""},
+            "$inc": {"revision": 1},
+        },
+    )
+    return result.modified_count > 0
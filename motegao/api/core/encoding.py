@@ -0,0 +1,121 @@
+import datetime
+import zlib
+
+import msgpack
+import orjson
+import zstandard
+from fastapi import HTTPException, Request, Response
+from fastapi.routing import APIRoute
+from starlette.datastructures import Headers, MutableHeaders
+
+MSGPACK = "application/msgpack"
+# Smaller bodies are not worth compressing
+COMPRESS_MIN_SIZE = 1024
+ZSTD_LEVEL = 3
+GZIP_LEVEL = 5
+# Same as client_max_body_size in nginx.conf, once decompressed
+REQUEST_MAX_SIZE = 100 * 1024 * 1024
+
+
+def default(value):
+    # ObjectIds and datetimes, which msgpack has no type for
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def accepts(header: str | None, value: str) -> bool:
+    for part in (header or "").split(","):
+        token, _, params = part.partition(";")
+        if token.strip() == value:
+            return params.replace(" ", "") not in ("q=0", "q=0.0")
+    return False
+
+
+def encoded_response(request: Request, content, status_code: int = 200) -> Response:
+    """Renders `content` as MessagePack or JSON and compresses it as the client accepts.
+
+    The body skips FastAPI's jsonable_encoder, orjson and msgpack serialize
+    the Mongo documents directly.
+    """
+
+    if accepts(request.headers.get("accept"), MSGPACK):
+        body = msgpack.packb(content, default=default)
+        media_type = MSGPACK
+    else:
+        body = orjson.dumps(content, default=default, option=orjson.OPT_NON_STR_KEYS)
+        media_type = "application/json"
+
+    encoding = None
+    if len(body) >= COMPRESS_MIN_SIZE:
+        accepted = request.headers.get("accept-encoding")
+        if accepts(accepted, "zstd"):
+            body = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+            encoding = "zstd"
+        elif accepts(accepted, "gzip"):
+            body = zlib.compress(body, GZIP_LEVEL, wbits=16 + zlib.MAX_WBITS)
+            encoding = "gzip"
+
+    response = Response(body, status_code=status_code, media_type=media_type)
+    response.headers["Vary"] = "Accept, Accept-Encoding"
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    return response
+
+
+def decompress(body: bytes, encoding: str) -> bytes:
+    if encoding == "zstd":
+        reader = zstandard.ZstdDecompressor().stream_reader(body)
+        data = reader.read(REQUEST_MAX_SIZE + 1)
+    elif encoding == "gzip":
+        data = zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(
+            body, REQUEST_MAX_SIZE + 1
+        )
+    else:
+        raise HTTPException(status_code=415, detail=f"Unsupported encoding: {encoding}")
+
+    if len(data) > REQUEST_MAX_SIZE:
+        raise HTTPException(status_code=413, detail="Request body too large")
+    return data
+
+
+class EncodedRequest(Request):
+    """Request whose body may be compressed (zstd, gzip) and/or MessagePack.
+
+    MessagePack bodies are announced to FastAPI as JSON and decoded by
+    `json()`, so endpoints validate them like any JSON body.
+    """
+
+    def __init__(self, scope, receive):
+        super().__init__(scope, receive)
+        headers = MutableHeaders(scope=dict(scope, headers=list(scope["headers"])))
+        self.msgpack = headers.get("content-type", "").startswith(MSGPACK)
+        if self.msgpack:
+            headers["content-type"] = "application/json"
+        self._headers = Headers(raw=headers.raw)
+
+    async def body(self) -> bytes:
+        if not hasattr(self, "_body"):
+            body = await super().body()
+            encoding = self.headers.get("content-encoding", "identity").lower()
+            if body and encoding != "identity":
+                body = decompress(body, encoding)
+            self._body = body
+        return self._body
+
+    async def json(self):
+        # FastAPI answers decoding errors with 422 (JSON) or 400 (MessagePack)
+        if not hasattr(self, "_json"):
+            body = await self.body()
+            self._json = msgpack.unpackb(body) if self.msgpack else orjson.loads(body)
+        return self._json
+
+
+class EncodedRoute(APIRoute):
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def encoded_handler(request: Request) -> Response:
+            return await handler(EncodedRequest(request.scope, request.receive))
+
+        return encoded_handler
@@ -21,6 +21,19 @@ class AppSettings(BaseAppSettings):
 
     REDIS_URL: str = "redis://localhost:6379"
 
+    TASK_STREAM_KEEPALIVE: int = 15  # seconds between SSE keepalive comments
+    # Longest a result request may wait for a change, below proxy read timeouts
+    TASK_LONG_POLL_MAX: int = 50
+
+    # Seconds identical commands are answered from the result cache, 0 disables
+    RESULT_CACHE_TTL_PING: int = 60
+    RESULT_CACHE_TTL_NMAP: int = 15 * 60
+    RESULT_CACHE_TTL_SUBDOMAIN_ENUM: int = 60 * 60
+    RESULT_CACHE_TTL_PATH_ENUM: int = 30 * 60
+
+    # Canvas storage of new projects, "split" keeps one document per element
+    PROJECT_CANVAS_STORAGE: str = "split"
+
     SECRET_KEY: str = "secret"
 
     API_PREFIX: str = ""
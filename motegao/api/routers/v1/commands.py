@@ -1,16 +1,59 @@
-from motegao.celery.app import celery
+import asyncio
+import collections
+import hashlib
+import json
+
+from motegao.celery.app import celery, redis_client
+from motegao.celery import (
+    cancellation,
+    groups,
+    persistence,
+    progress,
+    quotas,
+    result_cache,
+    sharding,
+    singleflight,
+    wordlists,
+)
 from motegao.celery.tasks.commands import (
+    dispatch,
+    force_cancel,
+    nmap_chunks,
     run_command_nmap,
     run_command_ping,
     run_command_subdomain_enum,
     run_command_path_enum,
 )
-from fastapi import APIRouter, HTTPException
+from celery import states
+from celery.utils import uuid
+from urllib.parse import urlparse
+
+from fastapi import (
+    APIRouter,
+    Depends,
+    Header,
+    HTTPException,
+    Query,
+    Response,
+    WebSocket,
+    WebSocketDisconnect,
+)
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from starlette.concurrency import run_in_threadpool
+
+from motegao import models
+from motegao.api.core import caching, deps
+from motegao.api.core.config import settings
 
 from motegao.models.cmd_request import (
+    BatchRequest,
     NmapRequest,
+    PingRequest,
     subdomainEnumRequest,
     PathEnumRequest,
+    TaskResultsRequest,
 )
 
 router = APIRouter(prefix="/commands", tags=["commands"])
@@ -25,32 +68,479 @@ ALLOWED_NMAP_OPTIONS = {
     "-sV",  # Version detection
 }
 
+# Cancelled tasks end with their partial result, they will not change again
+FINAL_STATES = states.READY_STATES | {cancellation.CANCELLED}
+
+
+def fetch_task_metas(task_ids: list[str]) -> dict:
+    """Reads the backend state of many tasks in one round trip where possible."""
+
+    backend = celery.backend
+    try:
+        keys = [backend.get_key_for_task(task_id) for task_id in task_ids]
+        values = backend.mget(keys)
+    except (AttributeError, NotImplementedError):
+        # rpc:// and other backends without key-value access
+        return {
+            task_id: {"status": task.status, "result": task.info}
+            for task_id, task in ((id, celery.AsyncResult(id)) for id in task_ids)
+        }
+
+    return {
+        task_id: backend.decode_result(value)
+        if value
+        else {"status": states.PENDING, "result": None}
+        for task_id, value in zip(task_ids, values)
+    }
+
+
+def select_fields(result, fields: list[str] | None):
+    if fields is None:
+        return result
+    if not isinstance(result, dict):
+        return None
+    return {key: value for key, value in result.items() if key in fields}
+
+
+def task_results(
+    task_ids: list[str],
+    since: dict[str, int] | None = None,
+    fields: list[str] | None = None,
+) -> dict:
+    """Returns the status and result of every task, batching the lookups.
+
+    Redis side channels (cache hits, quota queue, shard progress) are read in
+    one pipeline, the result backend in one multi-get and progress deltas in
+    a second pipeline. `fields` limits the result keys returned, deltas are
+    only read when the findings field is asked for.
+    """
+
+    since = since or {}
+    results = {}
+
+    pipe = redis_client.pipeline(transaction=False)
+    for task_id in task_ids:
+        pipe.get(result_cache.hit_key(task_id))
+        pipe.exists(quotas.queued_key(task_id))
+        pipe.lpos(quotas.PENDING_KEY, task_id)
+        pipe.hgetall(sharding.shards_key(task_id))
+    replies = pipe.execute()
+
+    infos = {}
+    for index, task_id in enumerate(task_ids):
+        hit, queued, position, shards = replies[4 * index : 4 * index + 4]
+        if hit is not None:
+            results[task_id] = {
+                "status": states.SUCCESS,
+                "result": select_fields(json.loads(hit), fields),
+                "cached": True,
+            }
+        elif queued:
+            # Waiting for a quota slot, not sent to the workers yet
+            results[task_id] = {
+                "status": "QUEUED",
+                "result": {"position": position or 0},
+            }
+        else:
+            infos[task_id] = sharding.shard_meta(shards)
+
+    metas = fetch_task_metas(list(infos)) if infos else {}
+
+    pending_deltas = []
+    for task_id, shards in infos.items():
+        status, info = metas[task_id]["status"], metas[task_id]["result"]
+
+        if status == states.PENDING and shards:
+            # Sharded enumerations only get a result once every shard is merged
+            status, info = "PROGRESS", shards
+
+        results[task_id] = {"status": status, "result": info}
+        if status == "PROGRESS" and isinstance(info, dict) and "field" in info:
+            if fields is None or info["field"] in fields:
+                pending_deltas.append(task_id)
+
+    if pending_deltas:
+        # Progress only carries deltas, rebuild the view (or the part after `since`)
+        pipe = redis_client.pipeline(transaction=False)
+        for task_id in pending_deltas:
+            pipe.lrange(progress.deltas_key(task_id), since.get(task_id, 0), -1)
+
+        for task_id, entries in zip(pending_deltas, pipe.execute()):
+            info = results[task_id]["result"]
+            items, cursor = progress.parse_deltas(entries, since.get(task_id, 0))
+            results[task_id]["result"] = {**info, info["field"]: items}
+            results[task_id]["cursor"] = cursor
+
+    for task_id in infos:
+        results[task_id]["result"] = select_fields(results[task_id]["result"], fields)
+
+    return results
+
+
+def result_etag(result: dict) -> str:
+    """Version of a task result, it changes with the state, progress or cursor."""
+
+    info = result["result"]
+    if result["status"] in FINAL_STATES:
+        # Final results do not change, skip hashing the whole payload
+        info = None
+    elif isinstance(info, dict) and "field" in info:
+        info = {key: value for key, value in info.items() if key != info["field"]}
+
+    version = json.dumps(
+        [result["status"], result.get("cursor"), result.get("cached"), info],
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha1(version.encode()).hexdigest()
+
+
+def combined_etag(results: dict) -> str:
+    etags = ",".join(result_etag(results[task_id]) for task_id in sorted(results))
+    return hashlib.sha1(etags.encode()).hexdigest()
+
+
+def parse_etag(value: str | None) -> str | None:
+    if not value:
+        return None
+    return value.removeprefix("W/").strip('"')
+
+
+async def wait_for_change(task_ids: list[str], etag: str | None, wait: int, compute):
+    """Runs `compute` until its etag differs from `etag` or `wait` seconds pass.
+
+    `compute` returns `(body, etag)` and runs in the threadpool. In between it
+    is only rerun when one of the tasks publishes an event, so a held request
+    costs a pub/sub subscription rather than a lookup per poll.
+    """
+
+    if not etag or wait <= 0 or not task_ids:
+        return await run_in_threadpool(compute)
+
+    pubsub = caching.redis_client.pubsub()
+    # Subscribe before the first lookup so no change falls in between
+    await pubsub.subscribe(*[progress.events_channel(task_id) for task_id in task_ids])
+
+    try:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + min(wait, settings.TASK_LONG_POLL_MAX)
+        body, current = await run_in_threadpool(compute)
+        while current == etag:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            message = await pubsub.get_message(
+                ignore_subscribe_messages=True, timeout=remaining
+            )
+            if message is not None:
+                body, current = await run_in_threadpool(compute)
+        return body, current
+    finally:
+        await pubsub.unsubscribe()
+        await pubsub.aclose()
+
+
+def etag_response(body, etag: str, supplied: str | None, response: Response):
+    if etag == supplied:
+        return Response(status_code=304, headers={"ETag": f'"{etag}"'})
+    response.headers["ETag"] = f'"{etag}"'
+    return body
+
+
+def read_task_result(task_id: str, since: int | None = None) -> dict:
+    return task_results([task_id], {task_id: since or 0})[task_id]
+
 
 @router.get("/{task_id}/result")
-def get_task_result(task_id: str):
-    task = celery.AsyncResult(task_id)
+async def get_task_result(
+    task_id: str,
+    response: Response,
+    since: int | None = None,
+    wait: int = Query(0, ge=0),
+    etag: str | None = None,
+    if_none_match: str | None = Header(None),
+):
+    """Returns the task result, long-polling while it still matches `etag`.
+
+    With `wait`, the request is held until the state, progress or findings
+    cursor change (or the wait runs out, answered 304) so clients can follow
+    tasks without polling at a fixed rate or a WebSocket-capable proxy.
+    """
+
+    supplied = parse_etag(etag or if_none_match)
+
+    def compute():
+        result = read_task_result(task_id, since)
+        return result, result_etag(result)
+
+    body, current = await wait_for_change([task_id], supplied, wait, compute)
+    return etag_response(body, current, supplied, response)
+
+
+@router.post("/results")
+async def get_task_results(payload: TaskResultsRequest, response: Response):
+    supplied = parse_etag(payload.etag)
+
+    def compute():
+        results = task_results(payload.task_ids, payload.since, payload.fields)
+        return results, combined_etag(results)
+
+    results, current = await wait_for_change(
+        payload.task_ids, supplied, payload.wait, compute
+    )
+    body = {"results": results, "etag": current}
+    return etag_response(body, current, supplied, response)
+
+
+async def task_events(task_id: str):
+    """Yields a snapshot of the task, then its progress events until it finishes."""
+
+    pubsub = caching.redis_client.pubsub()
+    # Subscribe before taking the snapshot so no event falls in between
+    await pubsub.subscribe(progress.events_channel(task_id))
+
+    try:
+        snapshot = await run_in_threadpool(read_task_result, task_id)
+        yield {"type": "snapshot", **snapshot}
+        if snapshot["status"] in FINAL_STATES:
+            return
+
+        cursor = snapshot.get("cursor", 0)
+        while True:
+            message = await pubsub.get_message(
+                ignore_subscribe_messages=True,
+                timeout=settings.TASK_STREAM_KEEPALIVE,
+            )
+            if message is None:
+                yield {"type": "keepalive"}
+                continue
+
+            event = json.loads(message["data"])
+            # Deltas up to the snapshot cursor are already in the snapshot
+            if event["type"] == "progress" and event["seq"] <= cursor:
+                event["items"] = []
+
+            if event["type"] == "status":
+                result = await run_in_threadpool(read_task_result, task_id)
+                yield {"type": "status", **result}
+                return
+
+            yield event
+    finally:
+        await pubsub.unsubscribe()
+        await pubsub.aclose()
+
+
+@router.get("/{task_id}/stream")
+async def stream_task(task_id: str):
+    async def event_source():
+        async for event in task_events(task_id):
+            if event["type"] == "keepalive":
+                yield ": keepalive\n\n"
+                continue
+            data = json.dumps(jsonable_encoder(event), default=str)
+            yield f"event: {event['type']}\ndata: {data}\n\n"
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-    return {"status": task.status, "result": task.info}
+
+@router.websocket("/{task_id}/ws")
+async def stream_task_ws(websocket: WebSocket, task_id: str):
+    await websocket.accept()
+    try:
+        async for event in task_events(task_id):
+            await websocket.send_text(json.dumps(jsonable_encoder(event), default=str))
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
 
 
 @router.get("/{task_id}/cancel")
-def cancel_task(task_id: str):
-    task = celery.AsyncResult(task_id)
-    result = task.result
+def cancel_task(
+    task_id: str,
+    current_user: models.users.User = Depends(deps.get_current_user),
+):
+    current = read_task_result(task_id)
+    result = current["result"]
+    if current["status"] in FINAL_STATES:
+        return current
+
+    # Identical requests share one task, only stop it once nobody follows it
+    remaining = singleflight.release(task_id, str(current_user.id))
+    if remaining < 0:
+        raise HTTPException(status_code=404, detail="Task not found")
+    if remaining:
+        return {"status": "DETACHED", "subscribers": remaining, "result": result}
+
+    if quotas.cancel_pending(task_id):
+        return {"status": "CANCELLED", "result": None}
+
+    # Tasks stop at their next check of the flag and store what they found as
+    # the CANCELLED result, sharded runs also flag their fan-out and shards
+    task_ids = [task_id, *sharding.child_ids(task_id)]
+    cancellation.request_cancel(task_ids)
+    force_cancel.apply_async((task_ids,), countdown=cancellation.CANCEL_TIMEOUT)
+
+    return {"status": "CANCELLING", "result": result}
+
+
+@router.delete("/cache/{cache_key}")
+def invalidate_cached_result(
+    cache_key: str,
+    current_user: models.users.User = Depends(deps.get_current_user),
+):
+    return {"invalidated": result_cache.invalidate(cache_key)}
+
+
+# Request fields that steer the submission and are not passed to the task
+SUBMIT_OPTIONS = {"shards", "force_refresh", "wait_for_slot", "project_id"}
+
+# Task doing the actual work of each command, its queue is the one back-pressure
+# is measured on
+COMMAND_TASKS = {
+    "ping": run_command_ping,
+    "nmap": run_command_nmap,
+    "subdomain_enum": run_command_subdomain_enum,
+    "path_enum": run_command_path_enum,
+}
+
+
+def submit_command(
+    current_user: models.users.User,
+    command: str,
+    params: dict,
+    submission: tuple,
+    target: str | None = None,
+    threads: int = 0,
+    producer=None,
+):
+    """Answers from the result cache when possible, otherwise enqueues the command.
+
+    Requests identical to a command that is still running attach to its task
+    instead. New tasks must fit in the user, target and queue quotas; when
+    they do not, the request fails with 429 or, with `wait_for_slot`, waits
+    until a slot frees up. `submission` is the `(name, args, kwargs)` passed
+    to `dispatch`, the `prepare_*` functions build the arguments per command.
+    """
+
+    # Runs and findings are saved under the project, only into the user's own
+    project_id = params.get("project_id")
+    if project_id:
+        owner = persistence.project_owner(project_id)
+        if owner is None:
+            raise HTTPException(status_code=404, detail="Project not found")
+        if owner != current_user.id:
+            raise HTTPException(
+                status_code=403, detail="Not authorized to access this project"
+            )
+
+    # Checked here, the sharded fan-out would only fail on the worker
+    custom_wordlist = params.get("custom_wordlist")
+    if custom_wordlist and not wordlists.custom_exists(custom_wordlist):
+        raise HTTPException(
+            status_code=404, detail=f"Wordlist not found: {custom_wordlist}"
+        )
+
+    ttl = getattr(settings, f"RESULT_CACHE_TTL_{command.upper()}")
+    key = result_cache.cache_key(command, params)
+
+    if ttl and not params.get("force_refresh"):
+        task_id = result_cache.lookup(key)
+        if task_id:
+            if project_id:
+                persistence.link_run(task_id, str(current_user.id), project_id)
+            return {"task_id": task_id, "cached": True, "cache_key": key}
+
+    if threads > quotas.QUOTA_TARGET_THREADS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {quotas.QUOTA_TARGET_THREADS} threads may run "
+            "against one host",
+        )
+
+    task_id = uuid()
+    current = singleflight.claim(key, task_id, str(current_user.id))
+    if current != task_id:
+        if project_id:
+            persistence.link_run(current, str(current_user.id), project_id)
+        return {"task_id": current, "cached": False, "attached": True, "cache_key": key}
+
+    semaphores = quotas.limits(
+        str(current_user.id), quotas.queue_for(COMMAND_TASKS[command]), target, threads
+    )
+    reason = quotas.acquire(task_id, semaphores)
+    if reason and not params.get("wait_for_slot"):
+        singleflight.release(task_id, str(current_user.id))
+        raise HTTPException(
+            status_code=429,
+            detail=reason,
+            headers={"Retry-After": str(quotas.QUOTA_RETRY_AFTER)},
+        )
+
+    if ttl:
+        result_cache.remember(task_id, key, ttl)
+    persistence.register_run(
+        task_id,
+        command,
+        target,
+        params,
+        owner=str(current_user.id),
+        project=project_id,
+    )
+
+    if reason:
+        quotas.enqueue_pending(task_id, semaphores, submission)
+        return {
+            "task_id": task_id,
+            "cached": False,
+            "attached": False,
+            "queued": True,
+            "cache_key": key,
+        }
+
+    try:
+        dispatch(task_id, *submission, producer=producer)
+    except Exception:
+        quotas.release(task_id)
+        singleflight.release(task_id, str(current_user.id))
+        raise
 
-    celery.control.revoke(task_id, terminate=True, signal="SIGKILL")
+    return {
+        "task_id": task_id,
+        "cached": False,
+        "attached": False,
+        "queued": False,
+        "cache_key": key,
+    }
 
-    return {"status": "CANCELLED", "result": result}
+
+def prepare_ping(payload: PingRequest):
+    submission = ("run_command_ping", [payload.host], {})
+    return "ping", payload.model_dump(), submission, payload.host.lower()
 
 
 @router.post("/ping")
-def ping(host: str):
-    task = run_command_ping.delay(host)
-    return {"task_id": task.id}
+def ping(
+    host: str,
+    force_refresh: bool = False,
+    wait_for_slot: bool = False,
+    project_id: str | None = None,
+    current_user: models.users.User = Depends(deps.get_current_user),
+):
+    payload = PingRequest(
+        host=host,
+        force_refresh=force_refresh,
+        wait_for_slot=wait_for_slot,
+        project_id=project_id,
+    )
+    return submit_command(current_user, *prepare_ping(payload))
 
 
-@router.post("/nmap")
-def nmap(payload: NmapRequest):
+def prepare_nmap(payload: NmapRequest):
     for opt in payload.options or []:
         if opt not in ALLOWED_NMAP_OPTIONS:
             raise HTTPException(status_code=400, detail=f"Option not allowed: {opt}")
@@ -72,6 +562,10 @@ def nmap(payload: NmapRequest):
         if payload.ports_range:
             if len(payload.ports_range) != 2:
                 raise HTTPException(400, "ports_range must contain exactly 2 values")
+            if not 0 < payload.ports_range[0] <= payload.ports_range[1] < 65536:
+                raise HTTPException(
+                    400, "ports_range must be a first and last port from 1 to 65535"
+                )
             parts.append(f"{payload.ports_range[0]}-{payload.ports_range[1]}")
 
         if payload.ports_specific:
@@ -79,27 +573,177 @@ def nmap(payload: NmapRequest):
 
         ports = f"-p{','.join(parts)}"
 
-    task = run_command_nmap.delay(
-        payload.timing_template,
-        payload.host,
-        "".join(payload.options) if payload.options else "",
-        ports,
-    )
+    args = [payload.timing_template, payload.host, payload.options or [], ports]
+    if payload.parallel:
+        try:
+            nmap_chunks(*args[:2], ports, payload.chunk_size)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        submission = ("parallel_nmap", args, {"chunk_size": payload.chunk_size})
+    else:
+        submission = ("run_command_nmap", args, {})
 
-    return {"task_id": task.id}
+    return "nmap", payload.model_dump(), submission, payload.host.lower()
+
+
+@router.post("/nmap")
+def nmap(
+    payload: NmapRequest,
+    current_user: models.users.User = Depends(deps.get_current_user),
+):
+    return submit_command(current_user, *prepare_nmap(payload))
+
+
+def prepare_subdomain_enum(payload: subdomainEnumRequest):
+    kwargs = payload.model_dump(exclude=SUBMIT_OPTIONS)
+    if payload.shards > 1:
+        submission = ("shard_command", ["subdomain_enum", kwargs, payload.shards], {})
+    else:
+        submission = ("run_command_subdomain_enum", [], kwargs)
+
+    return (
+        "subdomain_enum",
+        payload.model_dump(),
+        submission,
+        payload.domain.lower(),
+        payload.threads * payload.shards,
+    )
 
 
 @router.post("/subdomain_dns_enum")
-def subdomain_enum(payload: subdomainEnumRequest):
-    task = run_command_subdomain_enum.delay(
-        payload.domain, payload.threads, payload.wordlist
+def subdomain_enum(
+    payload: subdomainEnumRequest,
+    current_user: models.users.User = Depends(deps.get_current_user),
+):
+    return submit_command(current_user, *prepare_subdomain_enum(payload))
+
+
+def prepare_path_enum(payload: PathEnumRequest):
+    kwargs = payload.model_dump(exclude=SUBMIT_OPTIONS)
+    if payload.shards > 1:
+        submission = ("shard_command", ["path_enum", kwargs, payload.shards], {})
+    else:
+        submission = ("run_command_path_enum", [], kwargs)
+
+    return (
+        "path_enum",
+        payload.model_dump(),
+        submission,
+        urlparse(payload.url).hostname,
+        payload.threads * payload.shards,
     )
-    return {"task_id": task.id}
 
 
 @router.post("/path_enum")
-def path_enum(payload: PathEnumRequest):
-    task = run_command_path_enum.delay(
-        payload.url, payload.threads, payload.wordlist, payload.exclude_status
-    )
-    return {"task_id": task.id}
+def path_enum(
+    payload: PathEnumRequest,
+    current_user: models.users.User = Depends(deps.get_current_user),
+):
+    return submit_command(current_user, *prepare_path_enum(payload))
+
+
+# command -> (request model, preparation), for the commands of a batch
+BATCH_COMMANDS = {
+    "ping": (PingRequest, prepare_ping),
+    "nmap": (NmapRequest, prepare_nmap),
+    "subdomain_enum": (subdomainEnumRequest, prepare_subdomain_enum),
+    "path_enum": (PathEnumRequest, prepare_path_enum),
+}
+
+
+@router.post("/batch")
+def submit_batch(
+    payload: BatchRequest,
+    current_user: models.users.User = Depends(deps.get_current_user),
+):
+    """Submits many commands at once under a group id.
+
+    Every command is validated before any is submitted, then they are all
+    published over one broker connection. Commands refused by a quota, or
+    failing to submit, do not fail the others, they are reported with their
+    error instead.
+    """
+
+    prepared = []
+    errors = []
+    for index, spec in enumerate(payload.commands):
+        model, prepare = BATCH_COMMANDS[spec.command]
+        params = {
+            "project_id": payload.project_id,
+            "wait_for_slot": payload.wait_for_slot,
+            **spec.params,
+        }
+        try:
+            prepared.append(prepare(model(**params)))
+        except ValidationError as e:
+            detail = [{"loc": err["loc"], "msg": err["msg"]} for err in e.errors()]
+            errors.append({"index": index, "detail": detail})
+        except HTTPException as e:
+            errors.append({"index": index, "detail": e.detail})
+
+    if errors:
+        raise HTTPException(status_code=422, detail=errors)
+
+    tasks = []
+    with celery.producer_or_acquire() as producer:
+        for command in prepared:
+            try:
+                tasks.append(submit_command(current_user, *command, producer=producer))
+            except HTTPException as e:
+                tasks.append(
+                    {"task_id": None, "error": e.detail, "status_code": e.status_code}
+                )
+            except Exception as e:
+                # The commands submitted so far are running, they still get
+                # their group
+                print(f"❌ BATCH SUBMIT ERROR: {str(e)}")
+                tasks.append({"task_id": None, "error": str(e), "status_code": 500})
+
+    group_id = uuid()
+    task_ids = [task["task_id"] for task in tasks if task["task_id"]]
+    groups.register_group(group_id, task_ids, str(current_user.id))
+    return {"group_id": group_id, "tasks": tasks}
+
+
+def task_progress(result: dict) -> float:
+    if result["status"] in FINAL_STATES:
+        return 100.0
+    if isinstance(result["result"], dict):
+        return float(result["result"].get("progress") or 0)
+    return 0.0
+
+
+@router.get("/groups/{group_id}")
+async def get_group(
+    group_id: str,
+    response: Response,
+    wait: int = Query(0, ge=0),
+    etag: str | None = None,
+    if_none_match: str | None = Header(None),
+    current_user: models.users.User = Depends(deps.get_current_user),
+):
+    """Returns the aggregated progress of a batch, long-polling like task results."""
+
+    group = await run_in_threadpool(groups.group_info, group_id)
+    if group is None or group["owner"] != str(current_user.id):
+        raise HTTPException(status_code=404, detail="Group not found")
+
+    supplied = parse_etag(etag or if_none_match)
+    task_ids = group["task_ids"]
+
+    def compute():
+        results = task_results(task_ids, fields=["progress", "error"])
+        progress = [task_progress(results[task_id]) for task_id in task_ids]
+        body = {
+            "group_id": group_id,
+            "total": len(task_ids),
+            "statuses": collections.Counter(
+                result["status"] for result in results.values()
+            ),
+            "progress": round(sum(progress) / max(len(progress), 1), 2),
+            "tasks": results,
+        }
+        return body, combined_etag(results)
+
+    body, current = await wait_for_change(task_ids, supplied, wait, compute)
+    return etag_response(body, current, supplied, response)
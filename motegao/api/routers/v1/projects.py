@@ -1,15 +1,97 @@
-from fastapi import APIRouter, HTTPException, Depends
-from .schemas import ProjectSchema, ProjectCreateSchema, ProjectRenameSchema
+from fastapi import APIRouter, HTTPException, Depends, Header, Query, Request, Response
+from fastapi.responses import ORJSONResponse
+from .schemas import (
+    ProjectSchema,
+    ProjectCreateSchema,
+    ProjectRenameSchema,
+    ProjectPatchSchema,
+)
 from typing import List
 from beanie import PydanticObjectId
+from pymongo import ReturnDocument, UpdateOne
 import datetime
+import hashlib
 
 # ✅ Import Project มาจากที่เดียว และใช้ชื่อนี้ตลอดทั้งไฟล์
 from motegao.models.projects import Project
-from motegao.api.core import deps
+from motegao.api.core import canvas, deps
+from motegao.api.core.encoding import EncodedRoute, encoded_response
+from motegao.api.core.config import settings
 from motegao import models
+from .scans import cursor_filter, encode_cursor
 
-router = APIRouter(prefix="/projects", tags=["Projects"])
+# Canvases are large: requests may be MessagePack and/or compressed, and
+# responses are rendered with orjson
+router = APIRouter(
+    prefix="/projects",
+    tags=["Projects"],
+    route_class=EncodedRoute,
+    default_response_class=ORJSONResponse,
+)
+
+
+def revision_etag(revision: int) -> str:
+    # Clients build If-Match from the revision of the bodies, keep the format
+    return f'"r{revision}"'
+
+
+def cache_headers(etag: str) -> dict:
+    # Browsers revalidate every time, and get 304s while nothing changed
+    return {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+
+def etag_matches(header: str | None, etag: str) -> bool:
+    """Weak comparison of `etag` against an If-None-Match list."""
+
+    tags = [tag.strip().removeprefix("W/") for tag in (header or "").split(",")]
+    return "*" in tags or etag.removeprefix("W/") in tags
+
+
+def if_match_filter(if_match: str | None) -> dict:
+    """Returns the revision filter an If-Match header asks for.
+
+    Writes guarded by it match nothing when the project was saved since the
+    client loaded it, which the endpoints answer with 412.
+    """
+
+    if not if_match or if_match.strip() == "*":
+        return {}
+
+    revisions = []
+    for tag in if_match.split(","):
+        value = tag.strip().removeprefix("W/").strip('"')
+        if value.startswith("r") and value[1:].isdigit():
+            revisions.append(int(value[1:]))
+    if 0 in revisions:
+        # Documents saved before revisions existed have none
+        revisions.append(None)
+    return {"revision": {"$in": revisions}}
+
+
+async def listing_etag(owner, *parts) -> str:
+    """Returns the ETag of a user's project listing.
+
+    Saves bump a revision and set lastModified, deletes change the count,
+    and all three are read from the (owner, lastModified, _id, revision)
+    index without touching the projects themselves.
+    """
+
+    found = await Project.get_pymongo_collection().aggregate(
+        [
+            {"$match": {"owner": owner}},
+            {
+                "$group": {
+                    "_id": None,
+                    "count": {"$sum": 1},
+                    "revisions": {"$sum": "$revision"},
+                    "last": {"$max": "$lastModified"},
+                }
+            },
+        ]
+    )
+    state = next(iter(await found.to_list()), {})
+    key = repr([state.get(k) for k in ("count", "revisions", "last")] + list(parts))
+    return f'"{hashlib.sha1(key.encode()).hexdigest()[:20]}"'
 
 
 @router.post("/create")
@@ -19,113 +101,552 @@ async def create_project(
 ):
     try:
         # Create new project with authenticated user as owner
+        split = settings.PROJECT_CANVAS_STORAGE == canvas.SPLIT
         new_project = Project(
             name=project.name,
             owner=current_user.id,  # Set owner from authenticated user
-            nodes=project.nodes,
-            edges=project.edges,
+            nodes=[] if split else project.nodes,
+            edges=[] if split else project.edges,
+            storage=settings.PROJECT_CANVAS_STORAGE,
+            **canvas.summary_fields(project.nodes, project.edges),
         )
         await new_project.insert()
+        if split:
+            await canvas.replace_canvas(new_project.id, project.nodes, project.edges)
         return {"status": "success", "id": str(new_project.id)}
     except Exception as e:
         print(f"❌ CREATE ERROR: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.get("/my-projects", response_model=List[Project])
+@router.get("/my-projects")
 async def get_my_projects(
+    response: Response,
+    if_none_match: str | None = Header(None),
     current_user: models.users.User = Depends(deps.get_current_user),
 ):
+    """Returns the summaries of all the user's projects, like /list unpaged.
+
+    Canvases are not included, split projects do not store them on the
+    project. The graph of a project is served by /graph/{project_id}.
+    """
+
     try:
+        etag = await listing_etag(current_user.id, "all")
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=cache_headers(etag))
+
         # Return only projects owned by the authenticated user
-        projects = await Project.find(Project.owner == current_user.id).to_list()
+        found = await Project.get_pymongo_collection().aggregate(
+            summary_pipeline({"owner": current_user.id})
+        )
+        projects = [project_summary(project) for project in await found.to_list()]
+        response.headers.update(cache_headers(etag))
         return projects
     except Exception as e:
         print(f"❌ FETCH ERROR: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def summary_pipeline(match: dict, limit: int = 0) -> list:
+    """Aggregates project summaries without sending their canvases."""
+
+    pipeline = [{"$match": match}, {"$sort": {"lastModified": -1, "_id": -1}}]
+    if limit:
+        pipeline.append({"$limit": limit})
+
+    counts = {}
+    for field in canvas.CANVAS_FIELDS.values():
+        # Projects saved before the counts existed have their canvas embedded
+        stored = {"$size": {"$ifNull": [f"${field}", []]}}
+        counts[f"{field[:-1]}_count"] = {"$ifNull": [f"${field[:-1]}_count", stored]}
+
+    pipeline.append(
+        {
+            "$project": {
+                "name": 1,
+                "owner": 1,
+                # Strings saved by older versions, converted at API startup
+                "lastModified": {"$toDate": "$lastModified"},
+                "revision": {"$ifNull": ["$revision", 0]},
+                "storage": {"$ifNull": ["$storage", canvas.EMBEDDED]},
+                "thumbnail": {"$ifNull": ["$thumbnail", []]},
+                **counts,
+            }
+        }
+    )
+    return pipeline
+
+
+def project_summary(document: dict) -> dict:
+    summary = {key: value for key, value in document.items() if key != "owner"}
+    summary["id"] = str(summary.pop("_id"))
+    return summary
+
+
+@router.get("/list")
+async def list_projects(
+    response: Response,
+    cursor: str | None = None,
+    limit: int = Query(50, ge=1, le=200),
+    if_none_match: str | None = Header(None),
+    current_user: models.users.User = Depends(deps.get_current_user),
+):
+    """Pages through the user's projects, last modified first, without canvases.
+
+    Pass the returned cursor back to get the next page, it is None after the
+    last one. The graph of a project is served by /graph/{project_id}.
+    """
+
+    try:
+        etag = await listing_etag(current_user.id, cursor, limit)
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=cache_headers(etag))
+
+        match = {"owner": current_user.id, **cursor_filter(cursor, "lastModified")}
+        found = await Project.get_pymongo_collection().aggregate(
+            summary_pipeline(match, limit)
+        )
+        projects = await found.to_list()
+
+        next_cursor = None
+        if len(projects) == limit:
+            last = projects[-1]
+            next_cursor = encode_cursor(last["lastModified"], last["_id"])
+        projects = [project_summary(project) for project in projects]
+        response.headers.update(cache_headers(etag))
+        return {"projects": projects, "cursor": next_cursor}
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"❌ LIST ERROR: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.get("/detail/{project_id}")
 async def get_project_detail(
     project_id: str,
+    response: Response,
+    if_none_match: str | None = Header(None),
     current_user: models.users.User = Depends(deps.get_current_user),
 ):
     try:
-        # Find project and verify ownership
-        project = await Project.find_one(Project.id == PydanticObjectId(project_id))
+        # Find project and verify ownership, revalidation reads the revision only
+        collection = Project.get_pymongo_collection()
+        oid = PydanticObjectId(project_id)
+        project = await collection.find_one({"_id": oid}, {"owner": 1, "revision": 1})
         if not project:
             raise HTTPException(status_code=404, detail="Project not found")
 
         # Verify user owns this project
-        if project.owner != current_user.id:
+        if project.get("owner") != current_user.id:
             raise HTTPException(
                 status_code=403, detail="Not authorized to access this project"
             )
 
-        return project
+        etag = revision_etag(project.get("revision", 0))
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=cache_headers(etag))
+
+        found = await collection.aggregate(summary_pipeline({"_id": oid}))
+        project = next(iter(await found.to_list()), None)
+        if not project:
+            raise HTTPException(status_code=404, detail="Project not found")
+
+        response.headers.update(cache_headers(revision_etag(project["revision"])))
+        return project_summary(project)
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ DETAIL ERROR: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/graph/{project_id}")
+async def get_project_graph(
+    project_id: str,
+    request: Request,
+    if_none_match: str | None = Header(None),
+    current_user: models.users.User = Depends(deps.get_current_user),
+):
+    try:
+        # Find project and verify ownership, revalidation reads the revision only
+        collection = Project.get_pymongo_collection()
+        oid = PydanticObjectId(project_id)
+        project = await collection.find_one(
+            {"_id": oid}, {"owner": 1, "revision": 1, "storage": 1}
+        )
+        if not project:
+            raise HTTPException(status_code=404, detail="Project not found")
+
+        # Verify user owns this project
+        if project.get("owner") != current_user.id:
+            raise HTTPException(
+                status_code=403, detail="Not authorized to access this project"
+            )
+
+        # Weak, the body is encoded per Accept and Accept-Encoding
+        revision = project.get("revision", 0)
+        etag = f"W/{revision_etag(revision)}"
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=cache_headers(etag))
+
+        if project.get("storage") == canvas.SPLIT:
+            nodes = await canvas.load_elements(oid, "nodes")
+            edges = await canvas.load_elements(oid, "edges")
+        else:
+            project = await collection.find_one(
+                {"_id": oid}, {"revision": 1, "nodes": 1, "edges": 1}
+            )
+            nodes, edges = project.get("nodes") or [], project.get("edges") or []
+            revision = project.get("revision", 0)
+
+        body = {"nodes": nodes, "edges": edges, "revision": revision}
+        response = encoded_response(request, body)
+        response.headers.update(cache_headers(f"W/{revision_etag(revision)}"))
+        return response
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"❌ GRAPH ERROR: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.put("/update/{project_id}")
 async def update_project(
     project_id: str,
     update_data: dict,
+    response: Response,
+    if_match: str | None = Header(None),
     current_user: models.users.User = Depends(deps.get_current_user),
 ):
     try:
         # Find project and verify ownership
-        project = await Project.find_one(Project.id == PydanticObjectId(project_id))
+        collection = Project.get_pymongo_collection()
+        oid = PydanticObjectId(project_id)
+        project = await collection.find_one({"_id": oid}, {"owner": 1, "storage": 1})
         if not project:
             raise HTTPException(status_code=404, detail="Project not found")
 
         # Verify user owns this project
-        if project.owner != current_user.id:
+        if project.get("owner") != current_user.id:
             raise HTTPException(
                 status_code=403, detail="Not authorized to update this project"
             )
 
-        # Update project data
-        await project.set(
-            {
-                Project.nodes: update_data.get("nodes"),
-                Project.edges: update_data.get("edges"),
-                Project.lastModified: update_data.get("lastModified"),
-            }
+        # Update project data, timestamps come from the server so listings
+        # sort on dates only
+        nodes, edges = update_data.get("nodes"), update_data.get("edges")
+        fields = {
+            "lastModified": datetime.datetime.now(),
+            **canvas.summary_fields(nodes, edges),
+        }
+        split = project.get("storage") == canvas.SPLIT
+        if not split:
+            fields.update(nodes=nodes, edges=edges)
+
+        # The revision is bumped first so a stale If-Match fails before the
+        # canvas changes, and the storage checked in case it was just migrated
+        storage = canvas.SPLIT if split else {"$ne": canvas.SPLIT}
+        updated = await collection.find_one_and_update(
+            {"_id": oid, "storage": storage, **if_match_filter(if_match)},
+            # Also ends an unfinished patch, the canvas is replaced anyway
+            {"$set": fields, "$inc": {"revision": 1}, "$unset": {"patching": ""}},
+            projection={"revision": 1},
+            return_document=ReturnDocument.AFTER,
         )
-        return {"status": "success"}
+        if updated is None:
+            raise HTTPException(
+                status_code=412, detail="Project was changed since it was loaded"
+            )
+        if split:
+            await canvas.replace_canvas(oid, nodes, edges)
+
+        response.headers["ETag"] = revision_etag(updated["revision"])
+        return {"status": "success", "revision": updated["revision"]}
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ UPDATE ERROR: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.patch("/update/{project_id}")
+async def patch_project(
+    project_id: str,
+    patch: ProjectPatchSchema,
+    response: Response,
+    current_user: models.users.User = Depends(deps.get_current_user),
+):
+    """Applies canvas edits as targeted updates instead of rewriting the canvas.
+
+    The patch must name the revision it was made against, a stale one fails
+    with 409 and the client should reload or save the whole canvas.
+    Embedded canvases may need several updates: the first one marks the
+    project as being patched, which refuses other patches, and the last one
+    bumps the revision and clears the mark. A full save in between clears it
+    too, and the patch then fails with 409. Split canvases get their revision
+    bumped first, so concurrent patches against the old one fail before
+    touching it.
+    """
+
+    try:
+        collection = Project.get_pymongo_collection()
+        oid = PydanticObjectId(project_id)
+        # Only the ids are needed, do not load the whole canvas
+        project = await collection.find_one(
+            {"_id": oid},
+            {"owner": 1, "revision": 1, "storage": 1, "nodes.id": 1, "edges.id": 1},
+        )
+        if not project:
+            raise HTTPException(status_code=404, detail="Project not found")
+
+        # Verify user owns this project
+        if project.get("owner") != current_user.id:
+            raise HTTPException(
+                status_code=403, detail="Not authorized to update this project"
+            )
+
+        revision = project.get("revision", 0)
+        if revision != patch.revision:
+            raise HTTPException(
+                status_code=409,
+                detail=f"Project is at revision {revision}, not {patch.revision}",
+            )
+
+        existing = await canvas.existing_ids(project, patch.operations)
+        changes = canvas.fold_operations(patch.operations, existing)
+        split = project.get("storage") == canvas.SPLIT
+        statements = [({}, [])] if split else canvas.embedded_updates(changes)
+
+        # The last statement completes the patch
+        update, _ = statements[-1]
+        counts = canvas.count_update(project, changes)
+        update["$set"] = {
+            **update.get("$set", {}),
+            **counts.get("$set", {}),
+            "lastModified": datetime.datetime.now(),
+        }
+        update["$inc"] = {"revision": 1, **counts.get("$inc", {})}
+
+        marker = str(PydanticObjectId())
+        if len(statements) > 1:
+            update["$unset"] = {"patching": ""}
+            first, _ = statements[0]
+            first["$set"] = {**first.get("$set", {}), "patching": marker}
+
+        update, filters = statements[0]
+        result = await collection.update_one(
+            {
+                "_id": oid,
+                "revision": canvas.revision_guard(patch.revision),
+                "patching": None,
+            },
+            update,
+            array_filters=filters or None,
+        )
+        if result.matched_count == 0:
+            raise HTTPException(
+                status_code=409, detail="Project changed during the update"
+            )
+
+        if split:
+            await canvas.run_writes(canvas.split_writes(oid, changes))
+        elif len(statements) > 1:
+            result = await collection.bulk_write(
+                [
+                    UpdateOne(
+                        {"_id": oid, "patching": marker},
+                        update,
+                        array_filters=filters or None,
+                    )
+                    for update, filters in statements[1:]
+                ]
+            )
+            if result.matched_count < len(statements) - 1:
+                # A full save replaced the canvas meanwhile
+                raise HTTPException(
+                    status_code=409, detail="Project changed during the update"
+                )
+
+        response.headers["ETag"] = revision_etag(patch.revision + 1)
+        return {"status": "success", "revision": patch.revision + 1}
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"❌ PATCH ERROR: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+async def get_canvas_project(project_id: str, current_user: models.users.User):
+    """Returns the owner, storage and revision of an owned project."""
+
+    project = await Project.get_pymongo_collection().find_one(
+        {"_id": PydanticObjectId(project_id)}, {"owner": 1, "storage": 1, "revision": 1}
+    )
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+
+    # Verify user owns this project
+    if project.get("owner") != current_user.id:
+        raise HTTPException(
+            status_code=403, detail="Not authorized to access this project"
+        )
+    return project
+
+
+@router.get("/nodes/{project_id}")
+async def get_project_nodes(
+    project_id: str,
+    request: Request,
+    cursor: str | None = None,
+    limit: int = Query(500, ge=1, le=5000),
+    type: str | None = None,
+    x_min: float | None = None,
+    x_max: float | None = None,
+    y_min: float | None = None,
+    y_max: float | None = None,
+    current_user: models.users.User = Depends(deps.get_current_user),
+):
+    """Pages through the canvas nodes, optionally those of one type or in a viewport.
+
+    Pass the returned cursor back to get the next page, it is None after the
+    last one.
+    """
+
+    try:
+        project = await get_canvas_project(project_id, current_user)
+
+        # Split documents are queried, embedded arrays filtered in a projection
+        query, conditions = {}, []
+        if type:
+            query["type"] = type
+            conditions.append({"$eq": ["$$element.type", type]})
+        for axis, low, high in (("x", x_min, x_max), ("y", y_min, y_max)):
+            position = {"$ifNull": [f"$$element.position.{axis}", 0]}
+            if low is not None:
+                query.setdefault(axis, {})["$gte"] = low
+                conditions.append({"$gte": [position, low]})
+            if high is not None:
+                query.setdefault(axis, {})["$lte"] = high
+                conditions.append({"$lte": [position, high]})
+
+        if project.get("storage") == canvas.SPLIT:
+            nodes = await canvas.load_elements(
+                project["_id"], "nodes", query, cursor, limit
+            )
+        else:
+            nodes = await canvas.load_embedded_elements(
+                project["_id"], "nodes", conditions, cursor, limit
+            )
+        next_cursor = nodes[-1]["id"] if len(nodes) == limit else None
+        revision = project.get("revision", 0)
+        body = {"nodes": nodes, "cursor": next_cursor, "revision": revision}
+        return encoded_response(request, body)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"❌ NODES ERROR: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/edges/{project_id}")
+async def get_project_edges(
+    project_id: str,
+    request: Request,
+    cursor: str | None = None,
+    limit: int = Query(500, ge=1, le=5000),
+    node_ids: List[str] = Query(None),
+    current_user: models.users.User = Depends(deps.get_current_user),
+):
+    """Pages through the canvas edges, optionally only those touching `node_ids`.
+
+    Clients loading a viewport pass the ids of the nodes they got for it.
+    """
+
+    try:
+        project = await get_canvas_project(project_id, current_user)
+
+        query, conditions = {}, []
+        if node_ids:
+            ids = {"$in": node_ids}
+            query["$or"] = [{"source": ids}, {"target": ids}]
+            conditions.append(
+                {
+                    "$or": [
+                        {"$in": ["$$element.source", node_ids]},
+                        {"$in": ["$$element.target", node_ids]},
+                    ]
+                }
+            )
+
+        if project.get("storage") == canvas.SPLIT:
+            edges = await canvas.load_elements(
+                project["_id"], "edges", query, cursor, limit
+            )
+        else:
+            edges = await canvas.load_embedded_elements(
+                project["_id"], "edges", conditions, cursor, limit
+            )
+        next_cursor = edges[-1]["id"] if len(edges) == limit else None
+        revision = project.get("revision", 0)
+        body = {"edges": edges, "cursor": next_cursor, "revision": revision}
+        return encoded_response(request, body)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"❌ EDGES ERROR: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.put("/rename/{project_id}")
 async def rename_project(
     project_id: str,
     rename_data: ProjectRenameSchema,
+    response: Response,
+    if_match: str | None = Header(None),
     current_user: models.users.User = Depends(deps.get_current_user),
 ):
     try:
         # Find project and verify ownership
-        project = await Project.find_one(Project.id == PydanticObjectId(project_id))
+        collection = Project.get_pymongo_collection()
+        oid = PydanticObjectId(project_id)
+        project = await collection.find_one({"_id": oid}, {"owner": 1})
         if not project:
             raise HTTPException(status_code=404, detail="Project not found")
 
         # Verify user owns this project
-        if project.owner != current_user.id:
+        if project.get("owner") != current_user.id:
             raise HTTPException(
                 status_code=403, detail="Not authorized to rename this project"
             )
 
-        # Update project name and lastModified
-        await project.set(
+        # Update project name and lastModified, the detail ETag follows the revision
+        updated = await collection.find_one_and_update(
+            {"_id": oid, **if_match_filter(if_match)},
             {
-                Project.name: rename_data.name,
-                Project.lastModified: datetime.datetime.now(),
-            }
+                "$set": {
+                    "name": rename_data.name,
+                    "lastModified": datetime.datetime.now(),
+                },
+                "$inc": {"revision": 1},
+            },
+            projection={"revision": 1},
+            return_document=ReturnDocument.AFTER,
         )
-        return {"status": "success", "message": "Project renamed successfully"}
+        if updated is None:
+            raise HTTPException(
+                status_code=412, detail="Project was changed since it was loaded"
+            )
+
+        response.headers["ETag"] = revision_etag(updated["revision"])
+        return {
+            "status": "success",
+            "message": "Project renamed successfully",
+            "revision": updated["revision"],
+        }
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ RENAME ERROR: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -150,6 +671,7 @@ async def delete_project(
 
         # Delete the project
         await project.delete()
+        await canvas.delete_canvas(project.id)
         return {"status": "success", "message": "Project deleted successfully"}
     except Exception as e:
         print(f"❌ DELETE ERROR: {str(e)}")
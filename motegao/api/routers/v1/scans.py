@@ -0,0 +1,108 @@
+import datetime
+
+from beanie import PydanticObjectId
+from fastapi import APIRouter, Depends, HTTPException, Query
+
+from motegao import models
+from motegao.api.core import deps
+from motegao.models.projects import Project
+from motegao.models.scans import Finding, ScanRun
+
+router = APIRouter(prefix="/scans", tags=["scans"])
+
+
+async def get_owned_project(project_id: str, current_user: models.users.User):
+    if not PydanticObjectId.is_valid(project_id):
+        raise HTTPException(status_code=400, detail="Invalid project id")
+
+    # Only the owner is needed, do not load the canvas
+    project = await Project.get_pymongo_collection().find_one(
+        {"_id": PydanticObjectId(project_id)}, {"owner": 1}
+    )
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+    if project["owner"] != current_user.id:
+        raise HTTPException(
+            status_code=403, detail="Not authorized to access this project"
+        )
+    return project
+
+
+def encode_cursor(timestamp: datetime.datetime, id: PydanticObjectId) -> str:
+    return f"{timestamp.isoformat()}_{id}"
+
+
+def cursor_filter(cursor: str | None, field: str) -> dict:
+    """Matches the documents after `cursor` in (field, _id) descending order."""
+
+    if not cursor:
+        return {}
+    try:
+        timestamp, id = cursor.rsplit("_", 1)
+        timestamp, id = datetime.datetime.fromisoformat(timestamp), PydanticObjectId(id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    return {"$or": [{field: {"$lt": timestamp}}, {field: timestamp, "_id": {"$lt": id}}]}
+
+
+@router.get("/runs")
+async def list_runs(
+    project_id: str,
+    target: str | None = None,
+    cursor: str | None = None,
+    limit: int = Query(50, ge=1, le=500),
+    current_user: models.users.User = Depends(deps.get_current_user),
+):
+    project = await get_owned_project(project_id, current_user)
+
+    query = {"project": project["_id"], **cursor_filter(cursor, "started_at")}
+    if target:
+        query["target"] = target
+
+    runs = (
+        await ScanRun.find(query)
+        .sort(-ScanRun.started_at, -ScanRun.id)
+        .limit(limit + 1)
+        .to_list()
+    )
+    last = runs[limit - 1] if len(runs) > limit else None
+    return {
+        "items": runs[:limit],
+        "next": encode_cursor(last.started_at, last.id) if last else None,
+    }
+
+
+@router.get("/findings")
+async def list_findings(
+    project_id: str,
+    target: str | None = None,
+    kind: str | None = None,
+    run: str | None = None,
+    cursor: str | None = None,
+    limit: int = Query(100, ge=1, le=1000),
+    current_user: models.users.User = Depends(deps.get_current_user),
+):
+    # Newest first, served by the (project, discovered_at, _id) index or, with
+    # both target and kind, the (project, target, kind, discovered_at, _id) one
+    project = await get_owned_project(project_id, current_user)
+
+    query = {"project": project["_id"], **cursor_filter(cursor, "discovered_at")}
+    if target:
+        query["target"] = target
+    if kind:
+        query["kind"] = kind
+    if run:
+        query["run"] = run
+
+    findings = (
+        await Finding.find(query)
+        .sort(-Finding.discovered_at, -Finding.id)
+        .limit(limit + 1)
+        .to_list()
+    )
+    last = findings[limit - 1] if len(findings) > limit else None
+    return {
+        "items": findings[:limit],
+        "next": encode_cursor(last.discovered_at, last.id) if last else None,
+    }
@@ -1,6 +1,7 @@
 # ตำแหน่ง: app/schemas.py หรือ app/api/v1/schemas.py
-from pydantic import BaseModel, Field, field_validator
-from typing import List, Optional
+from fastapi import HTTPException
+from pydantic import BaseModel, Field, field_validator, model_validator
+from typing import List, Literal, Optional
 from beanie import PydanticObjectId
 import datetime
 
@@ -26,6 +27,38 @@ class ProjectRenameSchema(BaseModel):
         populate_by_name = True
 
 
+class CanvasOperation(BaseModel):
+    """One edit of a project canvas, nodes and edges are addressed by id"""
+
+    op: Literal["add", "update", "remove", "move"]
+    target: Literal["node", "edge"] = "node"
+    id: str
+    # add: the whole element, update: the top-level keys to replace
+    value: Optional[dict] = None
+    # move: the node's new {x, y}
+    position: Optional[dict] = None
+
+    @model_validator(mode="after")
+    def validate_operation(self):
+        if self.op in ("add", "update") and self.value is None:
+            raise HTTPException(status_code=400, detail=f"{self.op} needs a value")
+        if self.op == "move" and (self.target != "node" or self.position is None):
+            raise HTTPException(status_code=400, detail="move needs a node position")
+        for key in self.value or {}:
+            # Keys end up in MongoDB update paths
+            if not key or key.startswith("$") or "." in key:
+                raise HTTPException(status_code=400, detail=f"Invalid key: {key}")
+        return self
+
+
+class ProjectPatchSchema(BaseModel):
+    """Schema for incremental canvas updates"""
+
+    # Revision the operations were made against
+    revision: int = Field(..., ge=0)
+    operations: List[CanvasOperation] = Field(..., max_length=5000)
+
+
 class ProjectSchema(BaseModel):
     """Schema for project responses - uses proper types"""
 
@@ -0,0 +1,89 @@
+import os
+import shutil
+
+from fastapi import APIRouter, Depends, HTTPException, UploadFile
+from gridfs.asynchronous import AsyncGridFSBucket
+from starlette.concurrency import run_in_threadpool
+
+from motegao import models
+from motegao.api.core import deps
+from motegao.celery import wordlists
+
+router = APIRouter(prefix="/wordlists", tags=["wordlists"])
+
+
+def get_bucket() -> AsyncGridFSBucket:
+    return AsyncGridFSBucket(
+        models.beanie_client.db, bucket_name=wordlists.GRIDFS_BUCKET
+    )
+
+
+def count_lines(source: str):
+    try:
+        return len(wordlists.open_wordlist(source))
+    except FileNotFoundError:
+        return None
+
+
+@router.get("")
+async def list_wordlists(
+    current_user: models.users.User = Depends(deps.get_current_user),
+):
+    builtin = {}
+    for kind, available in (
+        ("subdomain", wordlists.SUBDOMAIN_WORDLISTS),
+        ("path", wordlists.PATH_WORDLISTS),
+    ):
+        builtin[kind] = [
+            {
+                "id": wordlist_id,
+                "name": name,
+                "lines": await run_in_threadpool(
+                    count_lines, os.path.join(wordlists.WORDLIST_DIR, name)
+                ),
+            }
+            for wordlist_id, name in available.items()
+        ]
+
+    # Uploaded lists live in GridFS, the line count is stored when compiling
+    custom = [
+        {"name": f.filename, "lines": (f.metadata or {}).get("lines")}
+        async for f in get_bucket().find({}).sort("filename", 1)
+    ]
+
+    return {**builtin, "custom": custom}
+
+
+@router.post("/upload")
+async def upload_wordlist(
+    file: UploadFile,
+    name: str | None = None,
+    current_user: models.users.User = Depends(deps.get_current_user),
+):
+    name = name or file.filename
+    try:
+        path = wordlists.custom_path(name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    bucket = get_bucket()
+    if await bucket.find({"filename": name}).to_list(1):
+        raise HTTPException(status_code=409, detail=f"Wordlist already exists: {name}")
+
+    def store():
+        os.makedirs(wordlists.CUSTOM_DIR, exist_ok=True)
+        with open(path, "wb") as f:
+            shutil.copyfileobj(file.file, f)
+        return len(wordlists.open_wordlist(path))
+
+    lines = await run_in_threadpool(store)
+
+    # Workers on other nodes download the list from GridFS on first use
+    with open(path, "rb") as f:
+        await bucket.upload_from_stream(
+            name,
+            f,
+            metadata={"lines": lines, "owner": str(current_user.id)},
+        )
+
+    return {"name": name, "lines": lines}
@@ -1,5 +1,8 @@
 import os
+import pymongo
+import redis
 from celery import Celery
+from kombu import Queue
 
 celery = Celery(
     "worker",
@@ -11,4 +14,42 @@ celery = Celery(
 celery.conf.update(
     task_track_started=True,
     result_extended=True,
-)
\ No newline at end of file
+    # Quick probes, port scans and brute-force enumerations are consumed by
+    # separate workers so short tasks never wait behind long ones
+    task_queues=[Queue("quick"), Queue("scan"), Queue("bruteforce")],
+    task_default_queue="quick",
+    task_routes={
+        "motegao.celery.tasks.commands.run_command_nmap*": {"queue": "scan"},
+        "motegao.celery.tasks.commands.run_command_subdomain_enum": {
+            "queue": "bruteforce"
+        },
+        "motegao.celery.tasks.commands.run_command_path_enum": {"queue": "bruteforce"},
+        "motegao.celery.tasks.commands.run_command_enum_shard": {"queue": "bruteforce"},
+    },
+    # 0-9, higher runs first. Only RabbitMQ orders messages by priority, on
+    # gcpubsub:// (production) they are ignored and the queues alone keep
+    # interactive tasks apart from enumerations
+    task_queue_max_priority=10,
+    task_default_priority=5,
+    # A worker only reserves the task it runs, long tasks do not hold back others
+    worker_prefetch_multiplier=1,
+)
+
+# Shared by workers and the API for task side channels (progress deltas, ...)
+redis_client = redis.Redis.from_url(
+    os.environ.get("REDIS_URL", "redis://localhost:6379")
+)
+
+mongo_client = None
+
+
+def get_mongo_db():
+    """Returns the default database, connecting lazily so each forked worker
+    child gets its own client."""
+    global mongo_client
+
+    if mongo_client is None:
+        mongo_client = pymongo.MongoClient(
+            os.environ.get("MONGODB_URI", "mongodb://localhost/motegaodb")
+        )
+    return mongo_client.get_default_database()
@@ -0,0 +1,87 @@
+import os
+
+from celery.exceptions import Ignore
+from celery.signals import task_postrun
+
+from motegao.celery.app import redis_client
+
+# Seconds before tasks that ignore their cancel flag are revoked with SIGKILL
+CANCEL_TIMEOUT = int(os.environ.get("CANCEL_TIMEOUT", "60"))
+CANCEL_TTL = 24 * 60 * 60
+
+CANCELLED = "CANCELLED"
+
+
+class Cancelled(Ignore):
+    """Ends a task whose CANCELLED state and partial result are already stored."""
+
+
+def cancel_key(task_id: str) -> str:
+    return f"motegao:tasks:{task_id}:cancel"
+
+
+def request_cancel(task_ids: list[str]):
+    pipe = redis_client.pipeline()
+    for task_id in task_ids:
+        pipe.set(cancel_key(task_id), 1, ex=CANCEL_TTL)
+    pipe.execute()
+
+
+def cancel_requested(*task_ids: str) -> bool:
+    return redis_client.exists(*[cancel_key(task_id) for task_id in task_ids]) > 0
+
+
+def pending_cancels(task_ids: list[str]) -> list[str]:
+    """Returns the tasks still flagged, the flag is cleared once a task ends."""
+
+    pipe = redis_client.pipeline(transaction=False)
+    for task_id in task_ids:
+        pipe.exists(cancel_key(task_id))
+    return [task_id for task_id, flagged in zip(task_ids, pipe.execute()) if flagged]
+
+
+def finish(task, reporter, result):
+    """Returns `result`, or ends the task as CANCELLED with its partial findings.
+
+    Shards return their partial result instead so the chord still runs the
+    merge, which settles the parent task.
+    """
+
+    if not reporter.check_cancelled() or not isinstance(result, dict):
+        return result
+
+    result = {
+        **result,
+        reporter.field: reporter.results,
+        "progress": reporter.progress,
+        "cancelled": True,
+    }
+    if reporter.task_id != task.request.id:
+        return result
+    stop(task, result)
+
+
+def stop(task, result):
+    task.update_state(state=CANCELLED, meta=result)
+    raise Cancelled()
+
+
+def merge_cancelled(task, results: list) -> bool:
+    if any(result.get("cancelled") for result in results):
+        return True
+    return cancel_requested(task.request.id)
+
+
+def finish_merge(task, results: list, merged: dict):
+    """Returns `merged`, or ends the merge as CANCELLED if any part was cancelled."""
+
+    if not merge_cancelled(task, results):
+        return merged
+
+    progress = sum(result.get("progress", 0) for result in results) / len(results)
+    stop(task, {**merged, "progress": round(progress, 2), "cancelled": True})
+
+
+@task_postrun.connect
+def clear_cancel_flag(task_id=None, **kwargs):
+    redis_client.delete(cancel_key(task_id))
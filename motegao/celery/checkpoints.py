@@ -0,0 +1,81 @@
+import collections
+import json
+
+from celery.signals import task_postrun
+
+from motegao.celery.app import redis_client
+
+CHECKPOINT_TTL = 24 * 60 * 60
+
+
+def checkpoint_key(task_id: str) -> str:
+    return f"motegao:tasks:{task_id}:checkpoint"
+
+
+def items_key(task_id: str) -> str:
+    return f"motegao:tasks:{task_id}:checkpoint:items"
+
+
+def queue_save(pipe, task_id: str, offset: int, progress: float, items: list):
+    """Adds the commands saving a checkpoint to `pipe`.
+
+    Findings are appended as they are flushed, so a checkpoint costs the new
+    items only and always matches the offset saved with it.
+    """
+
+    if items:
+        pipe.rpush(items_key(task_id), json.dumps(items))
+        pipe.expire(items_key(task_id), CHECKPOINT_TTL)
+    pipe.hset(checkpoint_key(task_id), mapping={"offset": offset, "progress": progress})
+    pipe.expire(checkpoint_key(task_id), CHECKPOINT_TTL)
+
+
+def load(task_id: str):
+    """Returns `(offset, progress, items)` of the last checkpoint, or None."""
+
+    pipe = redis_client.pipeline()
+    pipe.hgetall(checkpoint_key(task_id))
+    pipe.lrange(items_key(task_id), 0, -1)
+    checkpoint, batches = pipe.execute()
+    if not checkpoint:
+        return None
+
+    items = [item for batch in batches for item in json.loads(batch)]
+    return int(checkpoint[b"offset"]), float(checkpoint[b"progress"]), items
+
+
+class Watermark:
+    """Tracks the first wordlist line not yet tested when words finish out of order.
+
+    Every line before `offset` has been tested, so it is where a restarted
+    enumeration can pick up without skipping anything.
+    """
+
+    def __init__(self, offset: int, words):
+        self.start = self.offset = offset
+        self.source = words
+        self.issued = collections.defaultdict(collections.deque)
+        self.done = set()
+
+    def words(self):
+        for index, word in enumerate(self.source, self.start):
+            self.issued[word].append(index)
+            yield word
+
+    def complete(self, word) -> int:
+        # Repeated words are interchangeable, any of their lines will do
+        indices = self.issued[word]
+        self.done.add(indices.popleft())
+        if not indices:
+            del self.issued[word]
+
+        while self.offset in self.done:
+            self.done.remove(self.offset)
+            self.offset += 1
+        return self.offset
+
+
+@task_postrun.connect
+def clear_checkpoint(task_id=None, **kwargs):
+    # Only runs that were interrupted keep theirs, to be resumed on redelivery
+    redis_client.delete(checkpoint_key(task_id), items_key(task_id))
@@ -0,0 +1,292 @@
+import asyncio
+import random
+import socket
+import string
+import struct
+import time
+
+from motegao.celery.engines.limits import AdaptiveLimiter
+
+DEFAULT_RESOLVERS = ["1.1.1.1", "1.0.0.1", "8.8.8.8", "8.8.4.4", "9.9.9.9"]
+
+RCODE_NOERROR = 0
+RCODE_NXDOMAIN = 3
+TYPE_A = 1
+CLASS_IN = 1
+
+RECEIVE_BUFFER_SIZE = 4 * 1024 * 1024
+
+
+def parse_resolver(address: str):
+    """Parses `host` or `host:port` (IPv6 hosts go in brackets with a port)."""
+
+    if address.startswith("["):
+        host, _, port = address[1:].partition("]:")
+        return host.rstrip("]"), int(port or 53)
+
+    if address.count(":") == 1:
+        host, port = address.split(":")
+        return host, int(port)
+
+    return address, 53
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float | None = None):
+        self.rate = rate
+        self.capacity = burst or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def encode_name(name: str) -> bytes:
+    labels = name.strip(".").lower().encode("ascii").split(b".")
+    if any(not label or len(label) > 63 for label in labels):
+        raise ValueError(f"Invalid DNS name: {name}")
+    return b"".join(bytes([len(label)]) + label for label in labels) + b"\0"
+
+
+def build_query(query_id: int, qname: bytes) -> bytes:
+    # Standard query with recursion desired and a single A question
+    header = struct.pack("!HHHHHH", query_id, 0x0100, 1, 0, 0, 0)
+    return header + qname + struct.pack("!HH", TYPE_A, CLASS_IN)
+
+
+def skip_name(data: bytes, offset: int) -> int:
+    while True:
+        length = data[offset]
+        if length & 0xC0 == 0xC0:
+            return offset + 2
+        offset += 1 + length
+        if length == 0:
+            return offset
+
+
+def parse_response(data: bytes):
+    """Returns `(id, rcode, question name, A addresses)` of a response packet."""
+
+    query_id, flags, qdcount, ancount = struct.unpack_from("!HHHH", data)
+    offset = 12
+    qname_end = skip_name(data, offset)
+    qname = data[offset:qname_end].lower()
+    offset = qname_end + 4
+
+    addresses = set()
+    for _ in range(ancount):
+        offset = skip_name(data, offset)
+        rtype, rclass, _, rdlength = struct.unpack_from("!HHIH", data, offset)
+        offset += 10
+        if rtype == TYPE_A and rclass == CLASS_IN and rdlength == 4:
+            addresses.add(socket.inet_ntoa(data[offset : offset + 4]))
+        offset += rdlength
+
+    return query_id, flags & 0xF, qname, sorted(addresses)
+
+
+class ResolverProtocol(asyncio.DatagramProtocol):
+    def __init__(self):
+        # query id -> (question name, future)
+        self.pending = {}
+
+    def datagram_received(self, data, addr):
+        try:
+            query_id, rcode, qname, addresses = parse_response(data)
+        except (IndexError, struct.error):
+            return
+
+        name, future = self.pending.get(query_id, (None, None))
+        # Late answers to timed out queries may reuse an id, check the question
+        if future is None or future.done() or qname != name:
+            return
+
+        future.set_result((rcode, addresses))
+
+    def error_received(self, exc):
+        # ICMP errors show up as timeouts of the pending queries
+        pass
+
+
+class Resolver:
+    """One UDP socket to a resolver with many pipelined queries in flight."""
+
+    def __init__(self, address: str, rate: float):
+        self.address = parse_resolver(address)
+        self.bucket = TokenBucket(rate)
+        self.transport = None
+        self.protocol = None
+        self.next_id = random.randrange(0x10000)
+
+    async def open(self):
+        loop = asyncio.get_running_loop()
+        self.transport, self.protocol = await loop.create_datagram_endpoint(
+            ResolverProtocol, remote_addr=self.address
+        )
+        # Bursts of answers overflow the default receive buffer and get dropped
+        sock = self.transport.get_extra_info("socket")
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECEIVE_BUFFER_SIZE)
+        except OSError:
+            pass
+
+    def close(self):
+        if self.transport:
+            self.transport.close()
+
+    def allocate_id(self) -> int:
+        while True:
+            self.next_id = (self.next_id + 1) & 0xFFFF
+            if self.next_id not in self.protocol.pending:
+                return self.next_id
+
+    async def query(self, qname: bytes, timeout: float):
+        """Returns `(rcode, addresses)`, raises `asyncio.TimeoutError`."""
+
+        await self.bucket.acquire()
+
+        query_id = self.allocate_id()
+        future = asyncio.get_running_loop().create_future()
+        self.protocol.pending[query_id] = (qname, future)
+
+        try:
+            self.transport.sendto(build_query(query_id, qname))
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self.protocol.pending.pop(query_id, None)
+
+
+class DNSBruteForcer:
+    """Resolves `<word>.<domain>` for every word of a wordlist.
+
+    Queries are spread over the resolvers, each rate limited by its own token
+    bucket, with up to `window` lookups in flight: timeouts, SERVFAIL and
+    rising latency cut the number (see AdaptiveLimiter). Timeouts and SERVFAIL
+    answers are retried on another resolver with exponential backoff.
+    Wildcard DNS is detected once per run by resolving random labels; answers
+    that only contain wildcard addresses are not reported as found.
+    """
+
+    def __init__(
+        self,
+        domain: str,
+        resolvers: list[str] | None = None,
+        window: int = 500,
+        rate: float = 500,
+        retries: int = 3,
+        timeout: float = 2.0,
+        backoff: float = 0.25,
+    ):
+        self.domain = domain.strip(".")
+        self.resolvers = [
+            Resolver(address, rate) for address in resolvers or DEFAULT_RESOLVERS
+        ]
+        self.window = window
+        self.limiter = AdaptiveLimiter(window, initial=min(window, 50))
+        self.retries = retries
+        self.timeout = timeout
+        self.backoff = backoff
+        self.wildcard = set()
+
+    async def resolve(self, name: str):
+        """Returns the A records of `name`, [] if it does not exist, None on failure."""
+
+        try:
+            qname = encode_name(name)
+        except (UnicodeEncodeError, ValueError):
+            return []
+
+        for attempt in range(self.retries + 1):
+            resolver = random.choice(self.resolvers)
+            await self.limiter.acquire()
+            started = time.monotonic()
+            rcode = None
+            try:
+                rcode, addresses = await resolver.query(qname, self.timeout)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                await self.limiter.release(
+                    rcode not in (RCODE_NOERROR, RCODE_NXDOMAIN),
+                    time.monotonic() - started,
+                )
+
+            if rcode == RCODE_NXDOMAIN:
+                return []
+            if rcode == RCODE_NOERROR:
+                return addresses
+
+            await asyncio.sleep(self.backoff * 2**attempt)
+
+        return None
+
+    async def detect_wildcard(self, probes: int = 2):
+        labels = [
+            "".join(random.choices(string.ascii_lowercase + string.digits, k=20))
+            for _ in range(probes)
+        ]
+        answers = await asyncio.gather(
+            *(self.resolve(f"{label}.{self.domain}") for label in labels)
+        )
+        for addresses in answers:
+            self.wildcard.update(addresses or [])
+
+    async def lookup(self, word: str):
+        name = f"{word}.{self.domain}"
+        addresses = await self.resolve(name)
+
+        if addresses and self.wildcard and set(addresses) <= self.wildcard:
+            addresses = []
+
+        return word, name, addresses
+
+    async def run(self, words):
+        """Yields `(word, name, addresses)` for every word once it is resolved."""
+
+        results = asyncio.Queue()
+        words = iter(words)
+
+        async def worker():
+            try:
+                # The iterator is shared, every worker pulls the next word
+                for word in words:
+                    results.put_nowait(await self.lookup(word))
+            except Exception as e:
+                results.put_nowait(e)
+            finally:
+                results.put_nowait(None)
+
+        workers = []
+        try:
+            for resolver in self.resolvers:
+                await resolver.open()
+
+            await self.detect_wildcard()
+
+            workers = [asyncio.ensure_future(worker()) for _ in range(self.window)]
+            running = len(workers)
+            while running:
+                result = await results.get()
+                if result is None:
+                    running -= 1
+                elif isinstance(result, Exception):
+                    raise result
+                else:
+                    yield result
+        finally:
+            for lookup in workers:
+                lookup.cancel()
+            for resolver in self.resolvers:
+                resolver.close()
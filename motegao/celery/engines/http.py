@@ -0,0 +1,145 @@
+import asyncio
+import ssl
+import time
+from urllib.parse import quote
+
+import certifi
+import httpx
+
+from motegao.celery.engines.limits import AdaptiveLimiter
+
+try:
+    import h2  # noqa: F401
+
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+def retry_after(response: httpx.Response, default: float) -> float:
+    try:
+        return min(float(response.headers.get("retry-after", default)), 30.0)
+    except ValueError:
+        return default
+
+
+class HTTPPathEnumerator:
+    """Requests `<url>/<word>` for every word over pooled keep-alive connections.
+
+    Every worker owns one keep-alive connection (a single shared httpcore pool
+    spends most of its time scheduling waiting requests once there are many of
+    them), and uses HTTP/2 when `h2` is installed and the server negotiates it.
+    Concurrency adapts between 1 and `concurrency` (see AdaptiveLimiter): 429,
+    5xx and transport errors or rising latency cut it, fast successful answers
+    grow it back. 429 answers and transport errors are retried; responses with
+    a status in `exclude_status` are not reported, like gobuster's `-b`.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        concurrency: int = 10,
+        exclude_status: list[int] | None = None,
+        timeout: float = 10.0,
+        retries: int = 2,
+        backoff: float = 0.5,
+    ):
+        self.url = url.rstrip("/")
+        self.concurrency = concurrency
+        self.exclude_status = set(exclude_status or [404])
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.limiter = AdaptiveLimiter(concurrency, initial=min(concurrency, 10))
+        # Loading the CA bundle is slow, share one context between the clients
+        self.ssl_context = ssl.create_default_context(cafile=certifi.where())
+
+    def make_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE,
+            verify=self.ssl_context,
+            limits=httpx.Limits(max_connections=1, max_keepalive_connections=1),
+            timeout=self.timeout,
+            follow_redirects=False,
+        )
+
+    async def request(self, client: httpx.AsyncClient, path: str):
+        await self.limiter.acquire()
+        started = time.monotonic()
+        congested = False
+        try:
+            response = await client.get(f"{self.url}{path}")
+        except httpx.TransportError:
+            congested = True
+            raise
+        else:
+            congested = response.status_code == 429 or response.status_code >= 500
+            return response
+        finally:
+            await self.limiter.release(congested, time.monotonic() - started)
+
+    async def probe(self, client: httpx.AsyncClient, word: str):
+        """Returns the finding for `word`, or None if it was excluded or failed."""
+
+        path = "/" + word.lstrip("/")
+        # `#`, `?` and spaces are part of the word, not URL syntax
+        quoted = quote(path)
+
+        for attempt in range(self.retries + 1):
+            delay = self.backoff * 2**attempt
+            try:
+                response = await self.request(client, quoted)
+            except httpx.InvalidURL:
+                return None
+            except httpx.TransportError:
+                await asyncio.sleep(delay)
+                continue
+
+            if response.status_code == 429 and attempt < self.retries:
+                await asyncio.sleep(retry_after(response, delay))
+                continue
+
+            if response.status_code in self.exclude_status:
+                return None
+
+            return {
+                "path": path,
+                "status_code": str(response.status_code),
+                "size": str(len(response.content)),
+            }
+
+        return None
+
+    async def run(self, words):
+        """Yields `(word, finding)` for every word as soon as it is probed."""
+
+        results = asyncio.Queue()
+        words = iter(words)
+
+        async def worker(client):
+            try:
+                # The iterator is shared, every worker pulls the next word
+                for word in words:
+                    results.put_nowait((word, await self.probe(client, word)))
+            except Exception as e:
+                results.put_nowait(e)
+            finally:
+                results.put_nowait(None)
+
+        clients = [self.make_client() for _ in range(self.concurrency)]
+        workers = [asyncio.ensure_future(worker(client)) for client in clients]
+        try:
+            running = len(workers)
+            while running:
+                result = await results.get()
+                if result is None:
+                    running -= 1
+                elif isinstance(result, Exception):
+                    raise result
+                else:
+                    yield result
+        finally:
+            for probe in workers:
+                probe.cancel()
+            for client in clients:
+                await client.aclose()
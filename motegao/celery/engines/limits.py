@@ -0,0 +1,116 @@
+import asyncio
+import collections
+import time
+
+
+class AdaptiveLimiter:
+    """Concurrency limit tuned from the errors and latency of finished requests.
+
+    The limit grows by one per success until the first sign of congestion
+    (slow start), then by one per window of successes, and halves on errors
+    (429, 5xx, timeouts). Latency counts too: when the short-term average
+    rises above `tolerance` times the long-term one, requests are queueing at
+    the target and the limit shrinks in proportion. Decreases are spaced by
+    `cooldown` so one burst from requests already in flight only counts once.
+    The limit stays between `floor` and `ceiling`.
+
+    Blocked requests wait in FIFO order and a release wakes only as many of
+    them as there are free slots, engines start thousands of workers.
+    """
+
+    def __init__(
+        self,
+        ceiling: int,
+        floor: int = 1,
+        initial: int | None = None,
+        cooldown: float = 1.0,
+        tolerance: float = 2.0,
+    ):
+        self.ceiling = ceiling
+        self.floor = floor
+        self.cooldown = cooldown
+        self.tolerance = tolerance
+        # Slow start ramps up quickly, no need to open at the ceiling
+        self.limit = float(min(initial or ceiling, ceiling))
+        self.slow_start = True
+        self.in_flight = 0
+        self.last_decrease = 0.0
+        self.short_latency = None
+        self.long_latency = None
+        self.error_rate = 0.0
+        self.waiters = collections.deque()
+
+    def capacity(self) -> int:
+        return max(int(self.limit), self.floor)
+
+    async def acquire(self):
+        if not self.waiters and self.in_flight < self.capacity():
+            self.in_flight += 1
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        try:
+            # wake() counts the slot before handing it over
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Cancelled after being handed a slot, pass it on
+                self.in_flight -= 1
+                self.wake()
+            raise
+
+    def wake(self):
+        while self.waiters and self.in_flight < self.capacity():
+            waiter = self.waiters.popleft()
+            # Cancelled waiters stay queued until they come up
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    def observe(self, latency: float):
+        if self.short_latency is None:
+            self.short_latency = self.long_latency = latency
+            return
+        self.short_latency += 0.1 * (latency - self.short_latency)
+        self.long_latency += 0.01 * (latency - self.long_latency)
+
+    def queueing(self) -> bool:
+        if self.short_latency is None:
+            return False
+        return self.short_latency > self.tolerance * self.long_latency
+
+    def decrease(self, factor: float):
+        now = time.monotonic()
+        if now - self.last_decrease >= self.cooldown:
+            self.limit = max(float(self.floor), self.limit * factor)
+            self.last_decrease = now
+            self.slow_start = False
+
+    async def release(self, congested: bool = False, latency: float | None = None):
+        self.in_flight -= 1
+        self.error_rate += 0.05 * (float(congested) - self.error_rate)
+
+        if congested:
+            self.decrease(0.5)
+        else:
+            if latency is not None:
+                self.observe(latency)
+            if self.queueing():
+                gradient = self.tolerance * self.long_latency / self.short_latency
+                self.decrease(max(0.5, gradient))
+            elif self.slow_start:
+                self.limit = min(float(self.ceiling), self.limit + 1)
+            else:
+                self.limit = min(float(self.ceiling), self.limit + 1 / self.limit)
+
+        self.wake()
+
+    def snapshot(self) -> dict:
+        return {
+            "concurrency": self.capacity(),
+            "ceiling": self.ceiling,
+            "in_flight": self.in_flight,
+            "latency_ms": round((self.short_latency or 0) * 1000, 1),
+            "error_rate": round(self.error_rate, 3),
+        }
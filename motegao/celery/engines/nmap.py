@@ -0,0 +1,221 @@
+import os
+import re
+from ipaddress import ip_network
+from xml.etree.ElementTree import XMLPullParser
+
+# Largest network a parallel scan splits into chunks
+MAX_ADDRESSES = int(os.environ.get("NMAP_MAX_ADDRESSES", "65536"))
+
+HOSTNAME = re.compile(
+    r"^(?=.{1,253}\.?$)[a-z0-9_]([a-z0-9_-]{0,62})(\.[a-z0-9_][a-z0-9_-]{0,62})*\.?$",
+    re.IGNORECASE,
+)
+
+
+def parse_port(element) -> dict:
+    state = element.find("state")
+    service = element.find("service")
+    return {
+        "port": int(element.get("portid")),
+        "protocol": element.get("protocol"),
+        "state": state.get("state") if state is not None else None,
+        "reason": state.get("reason") if state is not None else None,
+        "service": {
+            key: service.get(key)
+            for key in ("name", "product", "version", "extrainfo", "tunnel")
+            if service.get(key)
+        }
+        if service is not None
+        else {},
+    }
+
+
+def parse_host(element) -> dict:
+    status = element.find("status")
+    addresses = [
+        {"addr": address.get("addr"), "type": address.get("addrtype")}
+        for address in element.findall("address")
+    ]
+    ip = next((a["addr"] for a in addresses if a["type"] in ("ipv4", "ipv6")), None)
+    return {
+        "address": ip or (addresses[0]["addr"] if addresses else None),
+        "addresses": addresses,
+        "hostnames": [
+            hostname.get("name") for hostname in element.iterfind("hostnames/hostname")
+        ],
+        "status": status.get("state") if status is not None else None,
+        "ports": [parse_port(port) for port in element.iterfind("ports/port")],
+    }
+
+
+class NmapXMLParser:
+    """Incremental parser for the XML nmap writes with `-oX -`.
+
+    Feed it output chunks as they arrive; every call returns the events the
+    chunk completed: `("host", record)` once nmap is done with a host and
+    `("progress", (phase, percent))` for `--stats-every` updates, where the
+    phase is the scan nmap is in (e.g. "SYN Stealth Scan"). Parsed hosts are
+    dropped from the tree, so memory does not grow with the scan.
+    """
+
+    def __init__(self):
+        self.parser = XMLPullParser(events=("start", "end"))
+        self.root = None
+        self.args = None
+        self.stats = {}
+
+    def feed(self, data: bytes) -> list:
+        self.parser.feed(data)
+        return self.events()
+
+    def close(self) -> list:
+        self.parser.close()
+        return self.events()
+
+    def events(self) -> list:
+        events = []
+        for event, element in self.parser.read_events():
+            if event == "start":
+                if element.tag == "nmaprun":
+                    self.root = element
+                    self.args = element.get("args")
+                continue
+
+            if element.tag == "host":
+                events.append(("host", parse_host(element)))
+                self.root.remove(element)
+            elif element.tag == "taskprogress":
+                percent = float(element.get("percent", 0))
+                events.append(("progress", (element.get("task"), percent)))
+                self.root.remove(element)
+            elif element.tag == "finished":
+                self.stats.update(
+                    {
+                        "elapsed": float(element.get("elapsed", 0)),
+                        "exit": element.get("exit"),
+                        "summary": element.get("summary"),
+                    }
+                )
+            elif element.tag == "hosts" and self.root is not None:
+                self.stats.update(
+                    {key: int(element.get(key, 0)) for key in ("up", "down", "total")}
+                )
+        return events
+
+
+def parse_ports(spec: str) -> list[int]:
+    """Expands an nmap `-p` argument like `-p22,80,1000-2000` (or `-p-`)."""
+
+    spec = spec.removeprefix("-p")
+    if spec in ("-", ""):
+        return list(range(1, 65536))
+
+    ports = set()
+    for part in spec.split(","):
+        start, dash, end = part.partition("-")
+        first = int(start) if start else 1
+        last = int(end) if end else (65535 if dash else first)
+        ports.update(range(first, last + 1))
+    return sorted(ports)
+
+
+def format_ports(ports: list[int]) -> str:
+    """Compresses sorted ports back into an nmap `-p` argument."""
+
+    ranges = []
+    for port in ports:
+        if ranges and port == ranges[-1][1] + 1:
+            ranges[-1][1] = port
+        else:
+            ranges.append([port, port])
+    return "-p" + ",".join(
+        str(start) if start == end else f"{start}-{end}" for start, end in ranges
+    )
+
+
+def parse_targets(targets: str) -> list[str]:
+    """Splits space or comma separated targets, each an address, network or host name.
+
+    Raises ValueError for anything else, nmap would read it as an option.
+    """
+
+    parsed = targets.replace(",", " ").split()
+    if not parsed:
+        raise ValueError("No target to scan")
+    for target in parsed:
+        try:
+            ip_network(target, strict=False)
+        except ValueError:
+            if not HOSTNAME.match(target):
+                raise ValueError(f"Invalid target: {target}")
+    return parsed
+
+
+def split_hosts(targets: str, size: int) -> list[list[str]]:
+    """Splits space or comma separated targets into lists of about `size` hosts.
+
+    CIDR networks are split into subnets of at most `size` addresses, names
+    and single addresses are grouped `size` at a time. Networks of more than
+    MAX_ADDRESSES addresses raise ValueError.
+    """
+
+    chunks, singles = [], []
+    for target in parse_targets(targets):
+        try:
+            network = ip_network(target, strict=False)
+        except ValueError:
+            singles.append(target)
+            continue
+
+        if network.num_addresses > MAX_ADDRESSES:
+            raise ValueError(
+                f"{target} has more than {MAX_ADDRESSES} addresses to split"
+            )
+        if network.num_addresses == 1:
+            singles.append(target)
+        elif network.num_addresses <= size:
+            chunks.append([str(network)])
+        else:
+            prefix = network.max_prefixlen - (size.bit_length() - 1)
+            chunks.extend([str(net)] for net in network.subnets(new_prefix=prefix))
+
+    chunks.extend(singles[i : i + size] for i in range(0, len(singles), size))
+    return chunks
+
+
+def split_ports(ports: str, size: int) -> list[str]:
+    """Splits an nmap `-p` argument into arguments of at most `size` ports.
+
+    Without an explicit port selection nmap scans its top ports, which are
+    left to a single chunk.
+    """
+
+    if not ports:
+        return [""]
+
+    expanded = parse_ports(ports)
+    return [
+        format_ports(expanded[i : i + size]) for i in range(0, len(expanded), size)
+    ]
+
+
+def merge_hosts(results: list[dict]) -> list[dict]:
+    """Merges the host records of several chunk scans into one table."""
+
+    hosts = {}
+    for result in results:
+        for host in result.get("hosts", []):
+            merged = hosts.setdefault(
+                host["address"], {**host, "hostnames": [], "ports": []}
+            )
+            if host["status"] == "up":
+                merged["status"] = "up"
+            for name in host["hostnames"]:
+                if name not in merged["hostnames"]:
+                    merged["hostnames"].append(name)
+            merged["ports"].extend(host["ports"])
+
+    for host in hosts.values():
+        ports = {(port["protocol"], port["port"]): port for port in host["ports"]}
+        host["ports"] = [ports[key] for key in sorted(ports)]
+    return list(hosts.values())
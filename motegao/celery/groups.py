@@ -0,0 +1,20 @@
+import json
+
+from motegao.celery.app import redis_client
+from motegao.celery.progress import PROGRESS_TTL
+
+
+def group_key(group_id: str) -> str:
+    return f"motegao:groups:{group_id}"
+
+
+def register_group(group_id: str, task_ids: list[str], owner: str):
+    """Records the tasks of a batch submission under one id."""
+
+    record = {"owner": owner, "task_ids": task_ids}
+    redis_client.set(group_key(group_id), json.dumps(record), ex=PROGRESS_TTL)
+
+
+def group_info(group_id: str) -> dict | None:
+    record = redis_client.get(group_key(group_id))
+    return json.loads(record) if record else None
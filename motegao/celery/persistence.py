@@ -0,0 +1,277 @@
+import datetime
+import json
+
+from bson import ObjectId
+from celery.signals import task_postrun
+from celery.utils import uuid
+from celery.utils.log import get_task_logger
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+
+from motegao.celery import cancellation
+from motegao.celery.app import get_mongo_db, redis_client
+
+logger = get_task_logger(__name__)
+
+# Result field of a command -> kind of its findings and the item's unique key
+FINDING_KINDS = {
+    "subdomains": ("subdomain", lambda item: item),
+    "paths": ("path", lambda item: item["path"]),
+    "hosts": ("host", lambda item: item["address"]),
+}
+
+RUN_RECORD_TTL = 24 * 60 * 60
+
+# task id -> run record, for the runs this worker process writes to
+runs = {}
+
+
+def run_key(task_id: str) -> str:
+    return f"motegao:tasks:{task_id}:run"
+
+
+def links_key(task_id: str) -> str:
+    return f"motegao:tasks:{task_id}:links"
+
+
+def register_run(
+    task_id: str,
+    command: str,
+    target: str | None,
+    params: dict,
+    owner: str | None = None,
+    project: str | None = None,
+):
+    """Marks `task_id` for persistence, the workers create its ScanRun."""
+
+    record = {
+        "command": command,
+        "target": target,
+        "params": params,
+        "owner": owner,
+        "project": project,
+    }
+    redis_client.set(run_key(task_id), json.dumps(record), ex=RUN_RECORD_TTL)
+
+
+def project_owner(project_id: str):
+    """Returns the owner id of a project, None if there is no such project."""
+
+    projects = get_mongo_db().projects
+    project = projects.find_one({"_id": ObjectId(project_id)}, {"owner": 1})
+    return project["owner"] if project else None
+
+
+def run_info(task_id: str) -> dict | None:
+    if task_id not in runs:
+        record = redis_client.get(run_key(task_id))
+        runs[task_id] = json.loads(record) if record else None
+    return runs[task_id]
+
+
+def object_id(value: str | None):
+    return ObjectId(value) if value else None
+
+
+def start_run(task_id: str):
+    """Creates the ScanRun of `task_id` unless it exists (shards share one)."""
+
+    run = run_info(task_id)
+    if run is None:
+        return
+
+    get_mongo_db().scan_runs.update_one(
+        {"task_id": task_id},
+        {
+            "$setOnInsert": {
+                "task_id": task_id,
+                "project": object_id(run["project"]),
+                "owner": object_id(run["owner"]),
+                "command": run["command"],
+                "target": run["target"],
+                "params": run["params"],
+                "status": "STARTED",
+                "error": None,
+                "findings": 0,
+                "started_at": datetime.datetime.now(),
+                "finished_at": None,
+            }
+        },
+        upsert=True,
+    )
+
+
+def finding_update(run: dict, task_id: str, kind: str, key: str, item, now) -> dict:
+    fields = {
+        "run": task_id,
+        "project": object_id(run["project"]),
+        "target": run["target"],
+        "kind": kind,
+        "key": key,
+        "discovered_at": now,
+    }
+    if kind != "host":
+        return {"$setOnInsert": {**fields, "data": item}}
+
+    # Chunks of a parallel scan each report part of a host's ports
+    fields.update({f"data.{name}": value for name, value in item.items()})
+    ports = fields.pop("data.ports")
+    return {"$setOnInsert": fields, "$addToSet": {"data.ports": {"$each": ports}}}
+
+
+def save_findings(task_id: str, field: str, items: list):
+    """Upserts one batch of findings, keyed by run, kind and item."""
+
+    run = run_info(task_id)
+    if run is None or field not in FINDING_KINDS or not items:
+        return
+
+    kind, item_key = FINDING_KINDS[field]
+    now = datetime.datetime.now()
+    try:
+        if not run.get("started"):
+            start_run(task_id)
+            run["started"] = True
+        operations = [
+            UpdateOne(
+                {"run": task_id, "kind": kind, "key": item_key(item)},
+                finding_update(run, task_id, kind, item_key(item), item, now),
+                upsert=True,
+            )
+            for item in items
+        ]
+        get_mongo_db().findings.bulk_write(operations, ordered=False)
+    except PyMongoError as e:
+        # Findings still reach the client through the task, do not fail the scan
+        logger.warning(f"Could not persist findings of {task_id}: {e}")
+
+
+def copy_findings(db, source: str, run: str, project):
+    """Copies the findings of run `source` to `run` of `project`, in the database."""
+
+    fields = {"target": 1, "kind": 1, "key": 1, "data": 1, "discovered_at": 1}
+    db.findings.aggregate(
+        [
+            {"$match": {"run": source}},
+            {
+                "$project": {
+                    "_id": 0,
+                    **fields,
+                    "run": {"$literal": run},
+                    "project": {"$literal": project},
+                }
+            },
+            {
+                "$merge": {
+                    "into": "findings",
+                    "on": ["run", "kind", "key"],
+                    "whenMatched": "keepExisting",
+                    "whenNotMatched": "insert",
+                }
+            },
+        ]
+    )
+
+
+def finish_link(db, task_id: str, link: dict):
+    """Gives a linked run the findings and outcome of the finished run `task_id`."""
+
+    source = db.scan_runs.find_one(
+        {"task_id": task_id}, {"status": 1, "error": 1, "finished_at": 1}
+    )
+    copy_findings(db, task_id, link["run"], object_id(link["project"]))
+    db.scan_runs.update_one(
+        {"task_id": link["run"]},
+        {
+            "$set": {
+                "status": source["status"],
+                "error": source.get("error"),
+                "findings": db.findings.count_documents({"run": link["run"]}),
+                "finished_at": source["finished_at"],
+            }
+        },
+    )
+
+
+def link_run(task_id: str, owner: str, project: str) -> str | None:
+    """Records a run of `project` answered by the existing run of `task_id`.
+
+    Cached and coalesced requests share the task of an earlier identical
+    request, whose findings are saved under that request's project. The
+    linked run gets a copy of them: right away if the task has finished,
+    otherwise when it does. Returns the linked run's id, None when there is
+    nothing to link (unknown run, or one of the same project).
+    """
+
+    record = redis_client.get(run_key(task_id))
+    db = get_mongo_db()
+    run = uuid()
+    link = json.dumps({"run": run, "project": project})
+    try:
+        base = db.scan_runs.find_one({"task_id": task_id})
+        base = base or (json.loads(record) if record else None)
+        if base is None or str(base.get("project")) == project:
+            return None
+
+        db.scan_runs.insert_one(
+            {
+                "task_id": run,
+                "source": task_id,
+                "project": object_id(project),
+                "owner": object_id(owner),
+                "command": base["command"],
+                "target": base["target"],
+                "params": base["params"],
+                "status": "STARTED",
+                "error": None,
+                "findings": 0,
+                "started_at": datetime.datetime.now(),
+                "finished_at": None,
+            }
+        )
+        redis_client.rpush(links_key(task_id), link)
+        redis_client.expire(links_key(task_id), RUN_RECORD_TTL)
+        # The task may have finished before the link was queued, whoever
+        # takes the link off the queue completes it
+        finished = db.scan_runs.find_one(
+            {"task_id": task_id, "finished_at": {"$ne": None}}, {"_id": 1}
+        )
+        if finished and redis_client.lrem(links_key(task_id), 1, link):
+            finish_link(db, task_id, json.loads(link))
+    except PyMongoError as e:
+        logger.warning(f"Could not link run {run} to {task_id}: {e}")
+    return run
+
+
+@task_postrun.connect
+def finish_run(task_id=None, state=None, retval=None, **kwargs):
+    if run_info(task_id) is None:
+        runs.pop(task_id, None)
+        return
+
+    error = retval.get("error") if isinstance(retval, dict) else None
+    if isinstance(retval, cancellation.Cancelled):
+        state = cancellation.CANCELLED
+    elif isinstance(retval, Exception):
+        error = str(retval)
+
+    try:
+        start_run(task_id)
+        db = get_mongo_db()
+        db.scan_runs.update_one(
+            {"task_id": task_id},
+            {
+                "$set": {
+                    "status": "FAILURE" if error else state,
+                    "error": str(error) if error else None,
+                    "findings": db.findings.count_documents({"run": task_id}),
+                    "finished_at": datetime.datetime.now(),
+                }
+            },
+        )
+        while link := redis_client.lpop(links_key(task_id)):
+            finish_link(db, task_id, json.loads(link))
+    except PyMongoError as e:
+        logger.warning(f"Could not finish run {task_id}: {e}")
+    finally:
+        runs.pop(task_id, None)
@@ -0,0 +1,191 @@
+import json
+import os
+import time
+
+from celery.signals import task_postrun
+
+from motegao.celery import cancellation, checkpoints
+from motegao.celery.app import redis_client
+
+PROGRESS_FLUSH_INTERVAL = float(os.environ.get("PROGRESS_FLUSH_INTERVAL", "1.0"))
+PROGRESS_FLUSH_COUNT = int(os.environ.get("PROGRESS_FLUSH_COUNT", "100"))
+PROGRESS_TTL = int(os.environ.get("PROGRESS_TTL", str(24 * 60 * 60)))
+
+
+def deltas_key(task_id: str) -> str:
+    return f"motegao:tasks:{task_id}:deltas"
+
+
+def events_channel(task_id: str) -> str:
+    return f"motegao:tasks:{task_id}:events"
+
+
+def finding_key(item) -> str:
+    # Paths are dicts, subdomains are plain names
+    return item["path"] if isinstance(item, dict) else item
+
+
+class ProgressReporter:
+    """Sends task progress as sequence-numbered deltas instead of full snapshots.
+
+    New findings are appended to a Redis list (one entry per flush) and the
+    task meta only carries the progress, the result field name and the number
+    of deltas published so far (the cursor for the next read). Flushes are
+    throttled by time and by pending count, and every flush is also published
+    on the task events channel for streaming. Flushes also pick up the cancel
+    flag of the task, loops stop early once `cancelled` is set.
+
+    Enumerations that `resume` from a checkpoint keep `offset` (the wordlist
+    line everything before has been tested) up to date and every flush saves
+    it together with the new findings.
+    """
+
+    def __init__(self, task, field: str, task_id: str | None = None):
+        self.task = task
+        self.field = field
+        # Findings can be published under another task id (e.g. a shard's parent)
+        self.task_id = task_id or task.request.id
+        self.key = deltas_key(self.task_id)
+        self.channel = events_channel(self.task_id)
+        self.results = []
+        self.pending = []
+        self.progress = 0.0
+        self.seq = 0
+        self.dirty = False
+        self.cancelled = False
+        self.offset = None
+        # Keys of the findings restored by `resume`, the lines after the
+        # checkpoint offset were tested again and find them again
+        self.seen = None
+        # Concurrency of adaptive engines, see engines.limits
+        self.rate = None
+        self.last_flush = time.monotonic()
+
+    def add(self, item):
+        if self.seen is not None:
+            if finding_key(item) in self.seen:
+                return
+            self.seen.add(finding_key(item))
+        self.results.append(item)
+        self.pending.append(item)
+        self.dirty = True
+        self.maybe_flush()
+
+    def set_progress(self, progress: float):
+        if progress != self.progress:
+            self.progress = progress
+            self.dirty = True
+        self.maybe_flush()
+
+    def maybe_flush(self):
+        if len(self.pending) >= PROGRESS_FLUSH_COUNT:
+            self.flush()
+        elif time.monotonic() - self.last_flush >= PROGRESS_FLUSH_INTERVAL:
+            self.flush()
+
+    def set_rate(self, rate: dict):
+        self.rate = rate
+
+    def meta(self) -> dict:
+        return {
+            "progress": self.progress,
+            "field": self.field,
+            "seq": self.seq,
+            "rate": self.rate,
+        }
+
+    def queue_progress(self, pipe):
+        """Hook to add progress bookkeeping commands to the flush pipeline."""
+
+    def overall_progress(self, replies) -> float:
+        return self.progress
+
+    def persist(self, items: list):
+        from motegao.celery import persistence
+
+        persistence.save_findings(self.task_id, self.field, items)
+
+    def resume(self, start: int) -> int:
+        """Restores the last checkpoint of the task, returns the line to go on from."""
+
+        checkpoint = checkpoints.load(self.task.request.id)
+        if checkpoint is None:
+            self.offset = start
+        else:
+            # The restored findings were published before the interruption
+            self.offset, self.progress, self.results = checkpoint
+            self.seen = {finding_key(item) for item in self.results}
+        return self.offset
+
+    def check_cancelled(self) -> bool:
+        # Shards also stop when their parent is cancelled
+        if not self.cancelled:
+            self.cancelled = cancellation.cancel_requested(
+                self.task.request.id, self.task_id
+            )
+        return self.cancelled
+
+    def flush(self):
+        from motegao.celery import singleflight
+
+        self.last_flush = time.monotonic()
+        self.check_cancelled()
+        if not self.dirty:
+            return
+
+        items = self.pending
+        pipe = redis_client.pipeline()
+        if items:
+            pipe.rpush(self.key, json.dumps({"items": items}))
+            pipe.expire(self.key, PROGRESS_TTL)
+        if self.offset is not None:
+            checkpoints.queue_save(
+                pipe, self.task.request.id, self.offset, self.progress, items
+            )
+        # Keeps identical requests attaching to the task while it makes progress
+        singleflight.queue_refresh(pipe, self.task_id)
+        self.queue_progress(pipe)
+        replies = pipe.execute()
+
+        if items:
+            # The list length is the cursor, it stays valid with several writers
+            self.seq = replies[0]
+            self.pending = []
+            self.persist(items)
+
+        event = {
+            "type": "progress",
+            **self.meta(),
+            "progress": self.overall_progress(replies),
+            "items": items,
+        }
+        redis_client.publish(self.channel, json.dumps(event))
+
+        self.task.update_state(state="PROGRESS", meta=self.meta())
+        self.dirty = False
+
+
+def read_deltas(task_id: str, since: int = 0):
+    """Returns the findings published after delta `since` and the next cursor."""
+
+    return parse_deltas(redis_client.lrange(deltas_key(task_id), since, -1), since)
+
+
+def parse_deltas(entries: list, since: int = 0):
+    items = []
+    for entry in entries:
+        items.extend(json.loads(entry)["items"])
+
+    return items, since + len(entries)
+
+
+@task_postrun.connect
+def publish_task_state(task_id=None, state=None, retval=None, **kwargs):
+    """Tells stream subscribers that the task reached a final state."""
+
+    if isinstance(retval, cancellation.Cancelled):
+        state = cancellation.CANCELLED
+
+    redis_client.publish(
+        events_channel(task_id), json.dumps({"type": "status", "status": state})
+    )
@@ -0,0 +1,229 @@
+import json
+import os
+import time
+
+from celery.signals import (
+    before_task_publish,
+    task_postrun,
+    task_prerun,
+    task_revoked,
+)
+
+from motegao.celery.app import celery, redis_client
+
+# Concurrent commands per user
+QUOTA_USER_TASKS = int(os.environ.get("QUOTA_USER_TASKS", "5"))
+# Brute-force threads all running commands may point at one target host
+QUOTA_TARGET_THREADS = int(os.environ.get("QUOTA_TARGET_THREADS", "100"))
+# Tasks waiting in one queue before new submissions are turned away
+QUOTA_QUEUE_DEPTH = int(os.environ.get("QUOTA_QUEUE_DEPTH", "100"))
+# Slots of tasks that never report back are reclaimed after this long
+QUOTA_SLOT_TTL = int(os.environ.get("QUOTA_SLOT_TTL", str(6 * 60 * 60)))
+# Seconds clients are told to wait before retrying a refused submission
+QUOTA_RETRY_AFTER = int(os.environ.get("QUOTA_RETRY_AFTER", "30"))
+
+PENDING_KEY = "motegao:quota:pending"
+
+
+def user_key(user_id: str) -> str:
+    return f"motegao:quota:user:{user_id}"
+
+
+def target_key(target: str) -> str:
+    return f"motegao:quota:target:{target}"
+
+
+def queue_key(queue: str) -> str:
+    return f"motegao:quota:queue:{queue}"
+
+
+def holder_key(task_id: str) -> str:
+    return f"motegao:tasks:{task_id}:quota"
+
+
+def queued_key(task_id: str) -> str:
+    return f"motegao:tasks:{task_id}:queued"
+
+
+# Every semaphore is a sorted set of holders scored by the time their slot
+# expires, plus a hash of the weight each holder takes.
+# KEYS: semaphores. ARGV: holder, now, expiry, then (weight, limit, hold) per
+# semaphore; hold=0 only checks there is room. Returns the 1-based index of
+# the first semaphore without room, or 0 once every slot is taken.
+ACQUIRE = redis_client.register_script(
+    """
+    local holder, now, expiry = ARGV[1], ARGV[2], ARGV[3]
+    for i, key in ipairs(KEYS) do
+        local weights = key .. ':weights'
+        local expired = redis.call('ZRANGEBYSCORE', key, '-inf', now)
+        for _, member in ipairs(expired) do
+            redis.call('ZREM', key, member)
+            redis.call('HDEL', weights, member)
+        end
+
+        local used = 0
+        for _, weight in ipairs(redis.call('HVALS', weights)) do
+            used = used + tonumber(weight)
+        end
+        if used + tonumber(ARGV[1 + 3 * i]) > tonumber(ARGV[2 + 3 * i]) then
+            return i
+        end
+    end
+
+    for i, key in ipairs(KEYS) do
+        if ARGV[3 + 3 * i] == '1' then
+            redis.call('ZADD', key, expiry, holder)
+            redis.call('HSET', key .. ':weights', holder, ARGV[1 + 3 * i])
+        end
+    end
+    return 0
+    """
+)
+
+
+def queue_for(task) -> str:
+    return celery.amqp.router.route({}, task.name)["queue"].name
+
+
+def limits(user_id: str, queue: str, target: str | None = None, threads: int = 0):
+    """Returns the semaphores a submission needs as `(key, weight, limit, hold)`."""
+
+    semaphores = [
+        (user_key(user_id), 1, QUOTA_USER_TASKS, True),
+        (queue_key(queue), 1, QUOTA_QUEUE_DEPTH, False),
+    ]
+    if target and threads:
+        semaphores.append((target_key(target), threads, QUOTA_TARGET_THREADS, True))
+    return semaphores
+
+
+def describe(key: str) -> str:
+    if key.startswith(user_key("")):
+        return f"Too many running commands, at most {QUOTA_USER_TASKS} per user"
+    if key.startswith(target_key("")):
+        return (
+            f"Target is busy, at most {QUOTA_TARGET_THREADS} "
+            "threads may run against one host"
+        )
+    return "Workers are busy, too many commands are waiting"
+
+
+def acquire(task_id: str, semaphores: list) -> str | None:
+    """Takes a slot in every semaphore for `task_id`, all or nothing.
+
+    Returns None on success, otherwise why there is no room.
+    """
+
+    now = time.time()
+    args = [task_id, now, now + QUOTA_SLOT_TTL]
+    for _, weight, limit, hold in semaphores:
+        args.extend([weight, limit, int(hold)])
+
+    index = ACQUIRE(keys=[key for key, *_ in semaphores], args=args)
+    if index:
+        return describe(semaphores[index - 1][0])
+
+    held = [key for key, *_, hold in semaphores if hold]
+    redis_client.set(holder_key(task_id), json.dumps(held), ex=QUOTA_SLOT_TTL)
+    return None
+
+
+def release(task_id: str) -> bool:
+    """Frees the slots held by `task_id`, returns whether it held any."""
+
+    held = redis_client.get(holder_key(task_id))
+    if held is None:
+        return False
+
+    pipe = redis_client.pipeline()
+    for key in json.loads(held):
+        pipe.zrem(key, task_id)
+        pipe.hdel(f"{key}:weights", task_id)
+    pipe.delete(holder_key(task_id))
+    pipe.execute()
+    return True
+
+
+def enqueue_pending(task_id: str, semaphores: list, dispatch: list):
+    """Parks a submission until `drain` finds room for it."""
+
+    submission = {"semaphores": semaphores, "dispatch": dispatch}
+    redis_client.set(queued_key(task_id), json.dumps(submission), ex=QUOTA_SLOT_TTL)
+    redis_client.rpush(PENDING_KEY, task_id)
+
+
+def queue_position(task_id: str) -> int | None:
+    """Returns how many submissions wait before `task_id`, None if it is not waiting."""
+
+    if not redis_client.exists(queued_key(task_id)):
+        return None
+    position = redis_client.lpos(PENDING_KEY, task_id)
+    return position if position is not None else 0
+
+
+def cancel_pending(task_id: str) -> bool:
+    redis_client.lrem(PENDING_KEY, 0, task_id)
+    return bool(redis_client.delete(queued_key(task_id)))
+
+
+def drain():
+    """Dispatches the waiting submissions that now fit in their quotas."""
+
+    from motegao.celery.tasks.commands import dispatch
+
+    for _ in range(redis_client.llen(PENDING_KEY)):
+        task_id = redis_client.lpop(PENDING_KEY)
+        if task_id is None:
+            break
+
+        task_id = task_id.decode()
+        submission = redis_client.get(queued_key(task_id))
+        if submission is None:
+            continue
+
+        submission = json.loads(submission)
+        if acquire(task_id, submission["semaphores"]):
+            redis_client.rpush(PENDING_KEY, task_id)
+            continue
+
+        redis_client.delete(queued_key(task_id))
+        try:
+            dispatch(task_id, *submission["dispatch"])
+        except Exception:
+            release(task_id)
+            raise
+
+
+@before_task_publish.connect
+def count_queued_task(headers=None, routing_key=None, **kwargs):
+    # Tracks queue depth for back-pressure until a worker picks the task up
+    key = queue_key(routing_key)
+    redis_client.zadd(key, {headers["id"]: time.time() + QUOTA_SLOT_TTL})
+    redis_client.hset(f"{key}:weights", headers["id"], 1)
+
+
+def uncount_queued_task(request):
+    queue = (request.delivery_info or {}).get("routing_key")
+    if queue:
+        redis_client.zrem(queue_key(queue), request.id)
+        redis_client.hdel(f"{queue_key(queue)}:weights", request.id)
+
+
+@task_prerun.connect
+def count_started_task(task=None, **kwargs):
+    uncount_queued_task(task.request)
+    # Submissions held back by the queue depth alone may fit now
+    drain()
+
+
+@task_revoked.connect
+def count_revoked_task(request=None, **kwargs):
+    uncount_queued_task(request)
+    if release(request.id):
+        drain()
+
+
+@task_postrun.connect
+def release_quota(task_id=None, **kwargs):
+    if release(task_id):
+        drain()
@@ -0,0 +1,110 @@
+import hashlib
+import json
+
+from celery.signals import task_success
+from celery.utils import uuid
+
+from motegao.celery.app import redis_client
+from motegao.celery.progress import PROGRESS_TTL
+
+# Fields that change how a command runs, not what it finds
+CACHE_EXCLUDE = {
+    "force_refresh",
+    "wait_for_slot",
+    "project_id",
+    "shards",
+    "parallel",
+    "chunk_size",
+}
+# List fields whose order does not matter
+UNORDERED_FIELDS = {"options", "ports_specific", "exclude_status", "resolvers"}
+
+
+def entry_key(key: str) -> str:
+    return f"motegao:cache:{key}"
+
+
+def pending_key(task_id: str) -> str:
+    return f"motegao:tasks:{task_id}:cache"
+
+
+def hit_key(task_id: str) -> str:
+    return f"motegao:tasks:{task_id}:cached"
+
+
+def normalize(params: dict) -> dict:
+    normalized = {}
+    for name, value in params.items():
+        if name in CACHE_EXCLUDE:
+            continue
+        if name in UNORDERED_FIELDS and value:
+            value = sorted(set(value))
+        elif name in ("host", "domain") and isinstance(value, str):
+            value = value.strip().lower()
+        normalized[name] = value
+    return normalized
+
+
+def cache_key(command: str, params: dict) -> str:
+    """Content address of a command run with the given request parameters."""
+
+    data = json.dumps(
+        {"command": command, "params": normalize(params)},
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def encode(result) -> str:
+    # Raw command outputs are bytes, the API returns them as text anyway
+    return json.dumps(
+        result, default=lambda o: o.decode() if isinstance(o, bytes) else str(o)
+    )
+
+
+def lookup(key: str) -> str | None:
+    """Returns a new task id already resolved with the cached result, or None."""
+
+    result = redis_client.get(entry_key(key))
+    if result is None:
+        return None
+
+    task_id = uuid()
+    redis_client.set(hit_key(task_id), result, ex=PROGRESS_TTL)
+    return task_id
+
+
+def cached_result(task_id: str):
+    """Returns `(True, result)` if `task_id` was answered from the cache."""
+
+    result = redis_client.get(hit_key(task_id))
+    if result is None:
+        return False, None
+    return True, json.loads(result)
+
+
+def remember(task_id: str, key: str, ttl: int):
+    """Caches the result of `task_id` under `key` for `ttl` seconds once it succeeds."""
+
+    redis_client.set(
+        pending_key(task_id), json.dumps({"key": key, "ttl": ttl}), ex=PROGRESS_TTL
+    )
+
+
+def invalidate(key: str) -> bool:
+    return bool(redis_client.delete(entry_key(key)))
+
+
+@task_success.connect
+def store_cached_result(sender=None, result=None, **kwargs):
+    record = redis_client.get(pending_key(sender.request.id))
+    if record is None:
+        return
+
+    # Failed scans report their error in the result, do not keep those
+    if isinstance(result, dict) and "error" in result:
+        return
+
+    record = json.loads(record)
+    redis_client.set(entry_key(record["key"]), encode(result), ex=record["ttl"])
@@ -0,0 +1,75 @@
+import json
+
+from motegao.celery.app import redis_client
+from motegao.celery.progress import PROGRESS_TTL, ProgressReporter
+
+
+def shards_key(task_id: str) -> str:
+    return f"motegao:tasks:{task_id}:shards"
+
+
+def children_key(task_id: str) -> str:
+    return f"motegao:tasks:{task_id}:children"
+
+
+def register_children(parent_id: str, child_ids: list[str]):
+    pipe = redis_client.pipeline()
+    pipe.sadd(children_key(parent_id), *child_ids)
+    pipe.expire(children_key(parent_id), PROGRESS_TTL)
+    pipe.execute()
+
+
+def child_ids(parent_id: str) -> list[str]:
+    return [child.decode() for child in redis_client.smembers(children_key(parent_id))]
+
+
+def register_shards(parent_id: str, field: str, shard_ids: list[str]):
+    """Records the shards of a parent task with their progress set to 0."""
+
+    key = shards_key(parent_id)
+    pipe = redis_client.pipeline()
+    pipe.hset(key, "meta", json.dumps({"field": field, "shards": len(shard_ids)}))
+    pipe.hset(key, mapping={str(i): 0.0 for i in range(len(shard_ids))})
+    pipe.expire(key, PROGRESS_TTL)
+    pipe.execute()
+    register_children(parent_id, shard_ids)
+
+
+def aggregate_progress(values: dict) -> float:
+    progress = [float(v) for k, v in values.items() if k not in ("meta", b"meta")]
+    return round(sum(progress) / max(len(progress), 1), 2)
+
+
+def shard_progress(parent_id: str):
+    """Returns the aggregated progress meta of a sharded task, or None."""
+
+    return shard_meta(redis_client.hgetall(shards_key(parent_id)))
+
+
+def shard_meta(values: dict):
+    """Aggregates the shards hash of a parent task, None if it is not sharded."""
+
+    if b"meta" not in values:
+        return None
+
+    meta = json.loads(values[b"meta"])
+    return {
+        "progress": aggregate_progress(values),
+        "field": meta["field"],
+        "shards": meta["shards"],
+    }
+
+
+class ShardProgressReporter(ProgressReporter):
+    """Publishes a shard's findings and progress under its parent task."""
+
+    def __init__(self, task, field: str, parent_id: str, shard: int):
+        super().__init__(task, field, task_id=parent_id)
+        self.shard = shard
+
+    def queue_progress(self, pipe):
+        pipe.hset(shards_key(self.task_id), str(self.shard), self.progress)
+        pipe.hgetall(shards_key(self.task_id))
+
+    def overall_progress(self, replies) -> float:
+        return aggregate_progress(replies[-1])
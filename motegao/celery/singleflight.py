@@ -0,0 +1,122 @@
+import os
+
+from celery.signals import task_postrun
+
+from motegao.celery.app import redis_client
+from motegao.celery.progress import PROGRESS_TTL
+
+# Seconds an in-flight entry outlives the last progress flush of its task, so
+# requests stop attaching to tasks whose worker was lost
+INFLIGHT_TTL = int(os.environ.get("INFLIGHT_TTL", "600"))
+
+
+def inflight_key(key: str) -> str:
+    return f"motegao:inflight:{key}"
+
+
+def owner_key(task_id: str) -> str:
+    return f"motegao:tasks:{task_id}:inflight"
+
+
+def subscribers_key(task_id: str) -> str:
+    return f"motegao:tasks:{task_id}:subscribers"
+
+
+# Returns the task running `key`, making ARGV[1] that task if there is none,
+# and marks subscriber ARGV[2] as following it
+CLAIM = redis_client.register_script(
+    """
+    local current = redis.call('GET', KEYS[1])
+    if not current then
+        current = ARGV[1]
+        redis.call('SET', KEYS[1], current, 'EX', ARGV[3])
+        local owner = 'motegao:tasks:' .. current .. ':inflight'
+        redis.call('SET', owner, KEYS[1], 'EX', ARGV[3])
+    end
+    local subscribers = 'motegao:tasks:' .. current .. ':subscribers'
+    redis.call('HSET', subscribers, ARGV[2], 1)
+    redis.call('EXPIRE', subscribers, ARGV[4])
+    return current
+    """
+)
+
+# Marks subscriber ARGV[1] as detached and returns how many still follow the
+# task, or -1 if it never followed it. Detaching twice changes nothing.
+RELEASE = redis_client.register_script(
+    """
+    local state = redis.call('HGET', KEYS[1], ARGV[1])
+    if not state then
+        return -1
+    end
+    redis.call('HSET', KEYS[1], ARGV[1], 0)
+    local remaining = 0
+    for _, following in ipairs(redis.call('HVALS', KEYS[1])) do
+        if following == '1' then
+            remaining = remaining + 1
+        end
+    end
+    return remaining
+    """
+)
+
+# Extends the in-flight entry of ARGV[1], unless another task took it over
+REFRESH = redis_client.register_script(
+    """
+    local key = redis.call('GET', KEYS[1])
+    if key and redis.call('GET', key) == ARGV[1] then
+        redis.call('EXPIRE', key, ARGV[2])
+        redis.call('EXPIRE', KEYS[1], ARGV[2])
+    end
+    """
+)
+
+# Forgets the in-flight entry of ARGV[1], unless another task took it over
+FINISH = redis_client.register_script(
+    """
+    local key = redis.call('GET', KEYS[1])
+    if key and redis.call('GET', key) == ARGV[1] then
+        redis.call('DEL', key)
+    end
+    redis.call('DEL', KEYS[1])
+    """
+)
+
+
+def claim(key: str, task_id: str, subscriber: str) -> str:
+    """Returns the id of the task already running `key`, or `task_id` if none is.
+
+    `subscriber` (a user id) follows the returned task either way.
+    """
+
+    current = CLAIM(
+        keys=[inflight_key(key)],
+        args=[task_id, subscriber, INFLIGHT_TTL, PROGRESS_TTL],
+    )
+    return current.decode()
+
+
+def release(task_id: str, subscriber: str) -> int:
+    """Detaches `subscriber` from `task_id` and returns how many still follow it.
+
+    Returns -1 when `subscriber` never followed the task. Once nobody does,
+    identical requests start a new task.
+    """
+
+    remaining = RELEASE(keys=[subscribers_key(task_id)], args=[subscriber])
+    if remaining == 0:
+        finish(task_id)
+    return remaining
+
+
+def queue_refresh(pipe, task_id: str):
+    REFRESH(keys=[owner_key(task_id)], args=[task_id, INFLIGHT_TTL], client=pipe)
+
+
+def finish(task_id: str):
+    FINISH(keys=[owner_key(task_id)], args=[task_id])
+
+
+@task_postrun.connect
+def finish_inflight(task_id=None, **kwargs):
+    # New identical requests start a new task (or hit the result cache) from now on
+    finish(task_id)
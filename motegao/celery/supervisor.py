@@ -0,0 +1,206 @@
+import ctypes
+import os
+import re
+import resource
+import selectors
+import signal
+import subprocess
+import sys
+import time
+
+# Wall-clock seconds each external tool may run before it is stopped
+TOOL_TIMEOUTS = {
+    "ping": int(os.environ.get("TOOL_TIMEOUT_PING", "30")),
+    "nmap": int(os.environ.get("TOOL_TIMEOUT_NMAP", str(6 * 60 * 60))),
+    "gobuster": int(os.environ.get("TOOL_TIMEOUT_GOBUSTER", str(4 * 60 * 60))),
+}
+# Address space cap per tool, 0 disables it. Go tools (gobuster) reserve
+# more virtual memory than they use, keep it generous.
+TOOL_MEMORY_LIMIT_MB = int(os.environ.get("TOOL_MEMORY_LIMIT_MB", "4096"))
+# Seconds a tool gets to exit after SIGTERM before its process group is killed
+TOOL_TERM_GRACE = float(os.environ.get("TOOL_TERM_GRACE", "5"))
+TOOL_POLL_INTERVAL = 1.0
+# Longer output lines are split, only the end of stderr is kept
+TOOL_MAX_LINE = 64 * 1024
+TOOL_STDERR_TAIL = 64 * 1024
+
+LINE_END = re.compile(rb"[\r\n]")
+
+PR_SET_PDEATHSIG = 1
+# Loaded up front, the child may not load libraries between fork and exec
+prctl = ctypes.CDLL(None).prctl if sys.platform.startswith("linux") else None
+
+
+def limit_resources(cpu_seconds: int):
+    parent = os.getpid()
+
+    def apply():
+        if prctl is not None:
+            # Tools run in their own session, a worker killed with SIGKILL (as
+            # force_cancel does) would otherwise leave them running untimed
+            prctl(PR_SET_PDEATHSIG, signal.SIGKILL)
+            if os.getppid() != parent:
+                os._exit(1)
+        resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+        # SIGXCPU at the soft limit, SIGKILL at the hard one
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + 10))
+        if TOOL_MEMORY_LIMIT_MB:
+            limit = TOOL_MEMORY_LIMIT_MB * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+    return apply
+
+
+class Tool:
+    """Runs an external scanner with a timeout, rlimits and its own process group.
+
+    Output is read through a selector so timeouts and cancellation are noticed
+    even while the tool is silent, and the tool is reaped with wait4 so its
+    CPU time and peak RSS end up in `usage`. Stopping it (timeout, cancel or
+    the reader going away) sends SIGTERM to the whole group, then SIGKILL
+    after TOOL_TERM_GRACE. On Linux the tool is also killed when the worker
+    process running it dies.
+    """
+
+    def __init__(self, cmd: list, timeout: int, reporter=None, merge_stderr=False):
+        self.cmd = cmd
+        self.timeout = timeout
+        self.reporter = reporter
+        self.merge_stderr = merge_stderr
+        self.process = None
+        self.returncode = None
+        self.timed_out = False
+        self.cancelled = False
+        self.stderr = bytearray()
+        self.usage = {}
+
+    @property
+    def error(self) -> str | None:
+        if self.timed_out:
+            return f"{self.cmd[0]} timed out after {self.timeout}s"
+        return None
+
+    def signal(self, signum: int):
+        try:
+            os.killpg(self.process.pid, signum)
+        except ProcessLookupError:
+            pass
+
+    def chunks(self):
+        """Yields the tool's stdout as it arrives, then reaps it."""
+
+        started = time.monotonic()
+        deadline = started + self.timeout
+        self.process = p = subprocess.Popen(
+            self.cmd,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT if self.merge_stderr else subprocess.PIPE,
+            start_new_session=True,
+            # Threaded tools may use more CPU seconds than wall-clock ones
+            preexec_fn=limit_resources(self.timeout * (os.cpu_count() or 1)),
+        )
+
+        selector = selectors.DefaultSelector()
+        selector.register(p.stdout, selectors.EVENT_READ)
+        if not self.merge_stderr:
+            selector.register(p.stderr, selectors.EVENT_READ)
+
+        stopped = None
+        finished = False
+        next_check = started
+        try:
+            while selector.get_map():
+                now = time.monotonic()
+                if stopped is None:
+                    if now >= deadline:
+                        self.timed_out = True
+                    elif self.reporter is not None and now >= next_check:
+                        self.cancelled = self.reporter.check_cancelled()
+                        next_check = now + TOOL_POLL_INTERVAL
+                    if self.timed_out or self.cancelled:
+                        self.signal(signal.SIGTERM)
+                        stopped = now
+                elif now - stopped >= TOOL_TERM_GRACE:
+                    break
+
+                for key, _ in selector.select(TOOL_POLL_INTERVAL):
+                    data = os.read(key.fd, 65536)
+                    if not data:
+                        selector.unregister(key.fileobj)
+                    elif key.fileobj is p.stdout:
+                        yield data
+                    else:
+                        self.stderr += data
+                        del self.stderr[:-TOOL_STDERR_TAIL]
+            finished = True
+        finally:
+            selector.close()
+            if stopped is None and not finished:
+                # The reader stopped early, do not leave the tool running
+                self.signal(signal.SIGTERM)
+                stopped = time.monotonic()
+            self.reap(stopped + TOOL_TERM_GRACE if stopped else deadline, started)
+            p.stdout.close()
+            if p.stderr:
+                p.stderr.close()
+
+    def reap(self, until: float, started: float):
+        """Waits for the tool to exit, killing it at `until`, and records its usage."""
+
+        p = self.process
+        exited = os.WEXITED | os.WNOHANG | os.WNOWAIT
+        while os.waitid(os.P_PID, p.pid, exited) is None:
+            if time.monotonic() >= until:
+                break
+            time.sleep(0.05)
+
+        # Kill what is left of the group (forked helpers too) while the exited,
+        # unreaped tool still holds the group id
+        self.signal(signal.SIGKILL)
+        _, status, usage = os.wait4(p.pid, 0)
+        self.returncode = p.returncode = os.waitstatus_to_exitcode(status)
+        self.usage = {
+            "wall_time": round(time.monotonic() - started, 3),
+            "cpu_time": round(usage.ru_utime + usage.ru_stime, 3),
+            "max_rss_kb": usage.ru_maxrss,
+            "returncode": self.returncode,
+            "timed_out": self.timed_out,
+        }
+
+    def lines(self):
+        """Yields output lines, `\\r` also ends one (progress bars redraw with it)."""
+
+        buffer = bytearray()
+        for data in self.chunks():
+            buffer += data
+            start = 0
+            while match := LINE_END.search(buffer, start):
+                if match.start() > start:
+                    yield buffer[start : match.start()].decode(errors="replace")
+                start = match.end()
+            del buffer[:start]
+
+            while len(buffer) > TOOL_MAX_LINE:
+                yield buffer[:TOOL_MAX_LINE].decode(errors="replace")
+                del buffer[:TOOL_MAX_LINE]
+
+        if buffer:
+            yield buffer.decode(errors="replace")
+
+    def run(self) -> str:
+        return b"".join(self.chunks()).decode(errors="replace")
+
+
+def combine_usage(results: list) -> dict:
+    """Sums the usage of the parts of a sharded or chunked run."""
+
+    usages = [result["usage"] for result in results if result.get("usage")]
+    if not usages:
+        return {}
+    return {
+        "wall_time": max(usage["wall_time"] for usage in usages),
+        "cpu_time": round(sum(usage["cpu_time"] for usage in usages), 3),
+        "max_rss_kb": max(usage["max_rss_kb"] for usage in usages),
+        "timed_out": any(usage["timed_out"] for usage in usages),
+    }
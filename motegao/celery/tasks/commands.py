@@ -1,54 +1,289 @@
+import contextlib
+import os
+import tempfile
+
+from celery import chord, states
+from celery.utils import uuid
+
 from motegao.celery.app import celery
+from motegao.celery.progress import ProgressReporter, finding_key, publish_task_state
+from motegao.celery import cancellation, checkpoints, sharding, supervisor, wordlists
+from motegao.celery import result_cache  # noqa: F401 stores results of cached runs
+from motegao.celery import singleflight  # also ends coalescing when runs finish
+from motegao.celery import quotas  # also frees quota slots when runs finish
+from motegao.celery import persistence  # also records how runs finished
 
 
-@celery.task()
+@celery.task(priority=9)
 def run_command_ping(host: str):
-    import subprocess
+    tool = supervisor.Tool(["ping", "-c", "3", host], supervisor.TOOL_TIMEOUTS["ping"])
+    output = tool.run()
+    if tool.error:
+        return {"error": tool.error, "output": output, "usage": tool.usage}
+    return {"output": output, "usage": tool.usage}
+
+
+NMAP_STATS_EVERY = "5s"
+# Ports per chunk of a parallel scan at -T3, halved or doubled per timing step
+NMAP_CHUNK_PORTS = int(os.environ.get("NMAP_CHUNK_PORTS", "4096"))
+NMAP_CHUNK_HOSTS = int(os.environ.get("NMAP_CHUNK_HOSTS", "64"))
+NMAP_MAX_CHUNKS = int(os.environ.get("NMAP_MAX_CHUNKS", "64"))
+
+
+def nmap_scan(reporter, timing_template, host, options=None, ports=""):
+    """Runs nmap with XML output and reports every host as soon as it is done."""
+
+    from motegao.celery.engines.nmap import NmapXMLParser
+
+    cmd = [
+        "nmap",
+        f"-T{timing_template}",
+        *(options or []),
+        *([ports] if ports else []),
+        "--stats-every",
+        NMAP_STATS_EVERY,
+        "-oX",
+        "-",
+        *(host if isinstance(host, list) else [host]),
+    ]
+
+    parser = NmapXMLParser()
+    tool = supervisor.Tool(cmd, supervisor.TOOL_TIMEOUTS["nmap"], reporter)
+    phase = None
+
+    def handle(events):
+        nonlocal phase
+        for event, value in events:
+            if event == "host":
+                reporter.add(value)
+                continue
+
+            # Every scan phase (ping, port, service scan) counts from 0 again,
+            # updates may only go back when a new phase starts
+            task, percent = value
+            if task != phase:
+                phase = task
+                reporter.set_progress(percent)
+            else:
+                reporter.set_progress(max(reporter.progress, percent))
+
+    for chunk in tool.chunks():
+        handle(parser.feed(chunk))
+
+    if tool.cancelled or tool.timed_out:
+        # Stopped on purpose, keep the hosts reported so far
+        reporter.flush()
+        result = {
+            "hosts": reporter.results,
+            "stats": parser.stats,
+            "command": parser.args,
+            "usage": tool.usage,
+        }
+        return {"error": tool.error, **result} if tool.error else result
+
+    if tool.returncode != 0 or parser.root is None:
+        errors = tool.stderr.decode(errors="replace").strip()
+        return {
+            "error": errors or f"nmap exited with status {tool.returncode}",
+            "usage": tool.usage,
+        }
 
-    return subprocess.run(
-        ["ping", "-c", "3", host], capture_output=True, text=True
-    ).stdout.encode()
+    handle(parser.close())
+    reporter.flush()
+    return {
+        "hosts": reporter.results,
+        "stats": parser.stats,
+        "command": parser.args,
+        "progress": 100.00,
+        "usage": tool.usage,
+    }
 
 
-@celery.task()
+@celery.task(bind=True, priority=6)
 def run_command_nmap(
-    timing_template: int, host: str, options: str = "", ports: str = ""
+    self, timing_template: int, host: str, options: list = None, ports: str = ""
 ):
-    import subprocess
+    reporter = ProgressReporter(self, "hosts")
+    result = nmap_scan(reporter, timing_template, host, options, ports)
+    return cancellation.finish(self, reporter, result)
+
+
+def nmap_chunks(timing_template, host, ports, chunk_size=None):
+    """Splits a scan into (hosts, ports) chunks, at most NMAP_MAX_CHUNKS of them.
+
+    Slow timing templates get smaller chunks so the scan spreads over more
+    workers, fast ones bigger chunks to save on per-process overhead. Targets
+    or ports that cannot be split raise ValueError.
+    """
 
-    return subprocess.run(
-        ["nmap", f"-T{timing_template}", options, ports, host],
-        capture_output=True,
-        text=True,
-    ).stdout.encode()
+    from motegao.celery.engines.nmap import split_hosts, split_ports
 
+    port_size = chunk_size or max(1, int(NMAP_CHUNK_PORTS * 2 ** (timing_template - 3)))
+    host_size = NMAP_CHUNK_HOSTS
 
-def run_command_yielder(cmd):
-    from subprocess import Popen, PIPE, STDOUT
+    while True:
+        host_chunks = split_hosts(host, host_size)
+        port_chunks = split_ports(ports, port_size)
+        if len(host_chunks) * len(port_chunks) <= NMAP_MAX_CHUNKS or host_size > 65536:
+            break
+        if len(port_chunks) > 1:
+            port_size *= 2
+        else:
+            host_size *= 2
+
+    chunks = [(hosts, chunk) for hosts in host_chunks for chunk in port_chunks]
+    if not chunks:
+        raise ValueError("Nothing to scan")
+    return chunks
 
-    p = Popen(cmd, stdout=PIPE, stderr=STDOUT, bufsize=1, text=True)
 
-    for line in p.stdout:
-        yield line.rstrip()
+@celery.task(bind=True, priority=6)
+def run_command_nmap_chunk(
+    self,
+    parent_id: str,
+    chunk: int,
+    timing_template: int,
+    hosts: list,
+    options: list,
+    ports: str,
+):
+    # Hosts split over port chunks are reported once per chunk, the merged
+    # result combines their ports
+    reporter = sharding.ShardProgressReporter(self, "hosts", parent_id, chunk)
+    result = nmap_scan(reporter, timing_template, hosts, options, ports)
+    return cancellation.finish(self, reporter, result)
+
 
-    p.wait()
+@celery.task(bind=True, priority=9)
+def merge_nmap_chunks(self, results: list):
+    from motegao.celery.engines.nmap import merge_hosts
 
+    errors = [result["error"] for result in results if "error" in result]
+    if errors and not cancellation.merge_cancelled(self, results):
+        return {"error": errors[0]}
 
-@celery.task(bind=True)
-def run_command_subdomain_enum(self, domain: str, threads: int = 10, wordlist: int = 1):
-    wordlist_files = {
-        1: "/usr/share/wordlists/subdomains-top1million-5000.txt",
-        2: "/usr/share/wordlists/subdomains-top1million-20000.txt",
-        3: "/usr/share/wordlists/subdomains-top1million-110000.txt",
+    hosts = merge_hosts(results)
+    merged = {
+        "hosts": hosts,
+        "stats": {
+            "elapsed": max(
+                result.get("stats", {}).get("elapsed", 0) for result in results
+            ),
+            "up": sum(host["status"] == "up" for host in hosts),
+            "total": len(hosts),
+        },
+        "progress": 100.00,
+        "chunks": len(results),
+        "usage": supervisor.combine_usage(results),
     }
+    return cancellation.finish_merge(self, results, merged)
+
+
+@contextlib.contextmanager
+def failing_parent(parent_id: str):
+    """Fails `parent_id` when a fan-out raises before its chord is sent.
+
+    Only the chord callback stores a result under `parent_id`, the id the
+    client polls. Without one it would stay PENDING and hold its quota slots
+    and in-flight entry until they expire.
+    """
+
+    try:
+        yield
+    except Exception as e:
+        celery.backend.mark_as_failure(parent_id, e)
+        publish_task_state(task_id=parent_id, state=states.FAILURE)
+        persistence.finish_run(task_id=parent_id, state=states.FAILURE, retval=e)
+        singleflight.finish(parent_id)
+        if quotas.release(parent_id):
+            quotas.drain()
+        raise
+
+
+@celery.task(bind=True, priority=9)
+def run_command_parallel_nmap(
+    self,
+    parent_id: str,
+    timing_template: int,
+    host: str,
+    options: list,
+    ports: str,
+    chunk_size: int = None,
+):
+    """Runs a scan as a chord of (hosts, ports) chunks merged under `parent_id`."""
 
-    progress = 0.0
-    wordlist_file = wordlist_files.get(wordlist, wordlist_files[1])
-    results = []
+    with failing_parent(parent_id):
+        chunks = nmap_chunks(timing_template, host, ports, chunk_size)
+        chunk_ids = [uuid() for _ in chunks]
+        sharding.register_shards(parent_id, "hosts", chunk_ids)
 
-    for line_output in run_command_yielder(
+        header = [
+            run_command_nmap_chunk.s(
+                parent_id, i, timing_template, hosts, options, chunk_ports
+            ).set(task_id=chunk_id)
+            for i, ((hosts, chunk_ports), chunk_id) in enumerate(
+                zip(chunks, chunk_ids)
+            )
+        ]
+        chord(header, merge_nmap_chunks.s()).apply_async(task_id=parent_id)
+
+    return {"chunks": len(chunk_ids)}
+
+
+def parallel_nmap(
+    timing_template: int,
+    host: str,
+    options: list,
+    ports: str,
+    chunk_size: int | None = None,
+    parent_id: str | None = None,
+    producer=None,
+) -> str:
+    """Dispatches a parallel nmap scan and returns the id of its merged result."""
+
+    parent_id = parent_id or uuid()
+    fanout = run_command_parallel_nmap.apply_async(
+        (parent_id, timing_template, host, options, ports, chunk_size),
+        producer=producer,
+    )
+    sharding.register_children(parent_id, [fanout.id])
+    return parent_id
+
+
+@contextlib.contextmanager
+def wordlist_file(wordlist, start: int = 0, end: int | None = None):
+    """Yields a plain text file of lines `start` to `end`, for external tools."""
+
+    fd, path = tempfile.mkstemp(suffix=".txt")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(wordlist.raw(start, end))
+        yield path
+    finally:
+        os.unlink(path)
+
+
+def gobuster(reporter, args: list) -> supervisor.Tool:
+    return supervisor.Tool(
+        ["gobuster", *args, "--no-error"],
+        supervisor.TOOL_TIMEOUTS["gobuster"],
+        reporter,
+        merge_stderr=True,
+    )
+
+
+def gobuster_tested(line_output: str) -> int:
+    # "Progress: 1234 / 4614 (26.74%)", words tested by this run
+    return int(line_output.split("Progress:")[1].split("/")[0])
+
+
+def gobuster_subdomain_enum(reporter, domain, wordlist_file, threads, done, total):
+    first = reporter.offset
+    # gobuster keeps a fixed number of threads, only the native engine adapts
+    reporter.set_rate({"concurrency": threads, "ceiling": threads})
+    tool = gobuster(
+        reporter,
         [
-            "gobuster",
             "dns",
             "-d",
             domain,
@@ -56,46 +291,123 @@ def run_command_subdomain_enum(self, domain: str, threads: int = 10, wordlist: i
             wordlist_file,
             "-t",
             str(threads),
-            "--no-error",
-        ]
-    ):
+        ],
+    )
+    for line_output in tool.lines():
         if "Progress" in line_output:
-            progress = float(line_output.split()[-1].strip()[1:5])
+            tested = gobuster_tested(line_output)
+            # Up to `threads` words are still in flight, do not count them as done
+            reporter.offset = first + max(tested - threads, 0)
+            reporter.set_progress(round((done + tested) * 100 / max(total, 1), 2))
         else:
             if "Found:" in line_output:
                 subdomain = line_output.split()[1].strip()
-                results.append(subdomain)
+                reporter.add(subdomain)
+
+    reporter.flush()
+    if tool.error:
+        return {
+            "error": tool.error,
+            "subdomains": reporter.results,
+            "usage": tool.usage,
+        }
+    return {"subdomains": reporter.results, "progress": 100.00, "usage": tool.usage}
+
+
+def native_subdomain_enum(reporter, domain, words, done, total, window, resolvers):
+    import asyncio
+    from motegao.celery.engines.dns import DNSBruteForcer
+
+    engine = DNSBruteForcer(domain, resolvers=resolvers, window=window)
+    watermark = checkpoints.Watermark(reporter.offset, words)
+    records = []
+
+    async def enumerate_subdomains():
+        nonlocal done
+        async for word, name, addresses in engine.run(watermark.words()):
+            done += 1
+            if addresses:
+                reporter.add(name)
+                records.append({"subdomain": name, "addresses": addresses})
+            reporter.offset = watermark.complete(word)
+            reporter.set_rate(engine.limiter.snapshot())
+            reporter.set_progress(round(done * 100 / max(total, 1), 2))
+            if reporter.cancelled:
+                break
+
+    asyncio.run(enumerate_subdomains())
 
-        self.update_state(
-            state="PROGRESS", meta={"progress": progress, "subdomains": results}
+    reporter.flush()
+    return {
+        "subdomains": reporter.results,
+        "records": records,
+        "wildcard": sorted(engine.wildcard),
+        "progress": 100.00,
+    }
+
+
+def subdomain_enum(
+    reporter,
+    domain: str,
+    threads: int = 10,
+    wordlist: int = 1,
+    engine: str = "gobuster",
+    window: int = 500,
+    resolvers: list = None,
+    custom_wordlist: str | None = None,
+    start: int = 0,
+    end: int | None = None,
+):
+    words = wordlists.load(wordlists.SUBDOMAIN_WORDLISTS, wordlist, custom_wordlist)
+    end = len(words) if end is None else end
+    # Redelivered after a worker was lost, skip what the last run got through
+    first = reporter.resume(start)
+
+    if engine == "native":
+        return native_subdomain_enum(
+            reporter,
+            domain,
+            words.lines(first, end),
+            first - start,
+            end - start,
+            window,
+            resolvers,
         )
 
-    return {"subdomains": results, "progress": 100.00}
+    with wordlist_file(words, first, end) as path:
+        return gobuster_subdomain_enum(
+            reporter, domain, path, threads, first - start, end - start
+        )
 
 
-@celery.task(bind=True)  # Add bind=True
-def run_command_path_enum(
-    self, url: str, threads: int = 10, wordlist: int = 1, exclude_status: list = None
+@celery.task(bind=True, priority=3, acks_late=True, reject_on_worker_lost=True)
+def run_command_subdomain_enum(
+    self,
+    domain: str,
+    threads: int = 10,
+    wordlist: int = 1,
+    engine: str = "gobuster",
+    window: int = 500,
+    resolvers: list = None,
+    custom_wordlist: str = None,
 ):
-    if exclude_status is None or len(exclude_status) == 0:
-        exclude_status = [404]
+    reporter = ProgressReporter(self, "subdomains")
+    result = subdomain_enum(
+        reporter, domain, threads, wordlist, engine, window, resolvers, custom_wordlist
+    )
+    return cancellation.finish(self, reporter, result)
 
-    wordlist_files = {
-        1: "/usr/share/wordlists/dirb-small.txt",
-        2: "/usr/share/wordlists/dirb-common.txt",
-        3: "/usr/share/wordlists/dirb-big.txt",
-        4: "/usr/share/wordlists/dirbuster-medium.txt",
-        5: "/usr/share/wordlists/dirbuster-big.txt",
-    }
 
+def gobuster_path_enum(
+    reporter, url, wordlist_file, threads, exclude_status, done, total
+):
+    first = reporter.offset
+    reporter.set_rate({"concurrency": threads, "ceiling": threads})
     counter = 0
-    wordlist_file = wordlist_files.get(wordlist, wordlist_files[1])
-    results = []
-    progress = 0.0
 
-    for line_output in run_command_yielder(
+    tool = gobuster(
+        reporter,
         [
-            "gobuster",
             "dir",
             "-u",
             url,
@@ -105,9 +417,9 @@ def run_command_path_enum(
             str(threads),
             "-b",
             ",".join(map(str, exclude_status)),
-            "--no-error",
-        ]
-    ):
+        ],
+    )
+    for line_output in tool.lines():
         if (
             "==============================================================="
             in line_output
@@ -120,11 +432,13 @@ def run_command_path_enum(
                 return {"error": error_msg}
 
             if "Progress" in line_output:
-                progress = float(line_output.split()[-1].strip()[1:5])
+                tested = gobuster_tested(line_output)
+                reporter.offset = first + max(tested - threads, 0)
+                reporter.set_progress(round((done + tested) * 100 / max(total, 1), 2))
             else:
                 if "/" in line_output:
                     path = line_output.split()
-                    results.append(
+                    reporter.add(
                         {
                             "path": path[0][5:],
                             "status_code": path[2][:-1],
@@ -132,8 +446,220 @@ def run_command_path_enum(
                         }
                     )
 
-            self.update_state(
-                state="PROGRESS", meta={"progress": progress, "paths": results}
+    reporter.flush()
+    if tool.error:
+        return {"error": tool.error, "paths": reporter.results, "usage": tool.usage}
+    return {"paths": reporter.results, "progress": 100.00, "usage": tool.usage}
+
+
+def native_path_enum(reporter, url, words, done, total, threads, exclude_status):
+    import asyncio
+    from motegao.celery.engines.http import HTTPPathEnumerator
+
+    engine = HTTPPathEnumerator(url, concurrency=threads, exclude_status=exclude_status)
+    watermark = checkpoints.Watermark(reporter.offset, words)
+
+    async def enumerate_paths():
+        nonlocal done
+        async for word, finding in engine.run(watermark.words()):
+            done += 1
+            if finding:
+                reporter.add(finding)
+            reporter.offset = watermark.complete(word)
+            reporter.set_rate(engine.limiter.snapshot())
+            reporter.set_progress(round(done * 100 / max(total, 1), 2))
+            if reporter.cancelled:
+                break
+
+    asyncio.run(enumerate_paths())
+
+    reporter.flush()
+    return {"paths": reporter.results, "progress": 100.00}
+
+
+def path_enum(
+    reporter,
+    url: str,
+    threads: int = 10,
+    wordlist: int = 1,
+    exclude_status: list = None,
+    engine: str = "gobuster",
+    custom_wordlist: str | None = None,
+    start: int = 0,
+    end: int | None = None,
+):
+    if exclude_status is None or len(exclude_status) == 0:
+        exclude_status = [404]
+
+    words = wordlists.load(wordlists.PATH_WORDLISTS, wordlist, custom_wordlist)
+    end = len(words) if end is None else end
+    first = reporter.resume(start)
+
+    if engine == "native":
+        return native_path_enum(
+            reporter,
+            url,
+            words.lines(first, end),
+            first - start,
+            end - start,
+            threads,
+            exclude_status,
+        )
+
+    with wordlist_file(words, first, end) as path:
+        return gobuster_path_enum(
+            reporter, url, path, threads, exclude_status, first - start, end - start
+        )
+
+
+@celery.task(bind=True, priority=3, acks_late=True, reject_on_worker_lost=True)
+def run_command_path_enum(
+    self,
+    url: str,
+    threads: int = 10,
+    wordlist: int = 1,
+    exclude_status: list = None,
+    engine: str = "gobuster",
+    custom_wordlist: str = None,
+):
+    reporter = ProgressReporter(self, "paths")
+    result = path_enum(
+        reporter, url, threads, wordlist, exclude_status, engine, custom_wordlist
+    )
+    return cancellation.finish(self, reporter, result)
+
+
+# command -> (enumeration, result field, wordlists)
+ENUMERATIONS = {
+    "subdomain_enum": (subdomain_enum, "subdomains", wordlists.SUBDOMAIN_WORDLISTS),
+    "path_enum": (path_enum, "paths", wordlists.PATH_WORDLISTS),
+}
+
+
+@celery.task(bind=True, priority=3, acks_late=True, reject_on_worker_lost=True)
+def run_command_enum_shard(
+    self, parent_id: str, shard: int, command: str, kwargs: dict, start, end
+):
+    enumeration, field, _ = ENUMERATIONS[command]
+    reporter = sharding.ShardProgressReporter(self, field, parent_id, shard)
+    result = enumeration(reporter, start=start, end=end, **kwargs)
+    return cancellation.finish(self, reporter, result)
+
+
+@celery.task(bind=True, priority=9)
+def merge_enum_shards(self, results: list, field: str):
+    errors = [result["error"] for result in results if "error" in result]
+    if errors and not cancellation.merge_cancelled(self, results):
+        return {"error": errors[0]}
+
+    merged = {}
+    for result in results:
+        for item in result.get(field, []):
+            merged.setdefault(finding_key(item), item)
+
+    return cancellation.finish_merge(
+        self,
+        results,
+        {
+            field: list(merged.values()),
+            "progress": 100.00,
+            "shards": len(results),
+            "usage": supervisor.combine_usage(results),
+        },
+    )
+
+
+@celery.task(bind=True, priority=9)
+def run_command_sharded_enum(
+    self, parent_id: str, command: str, kwargs: dict, shards: int
+):
+    """Splits the wordlist into line ranges and runs them as a chord of shards.
+
+    The chord callback merges the shard results under `parent_id`, the task id
+    the client was given.
+    """
+
+    _, field, builtin_wordlists = ENUMERATIONS[command]
+    with failing_parent(parent_id):
+        words = wordlists.load(
+            builtin_wordlists, kwargs.get("wordlist", 1), kwargs.get("custom_wordlist")
+        )
+
+        ranges = words.ranges(shards)
+        shard_ids = [uuid() for _ in ranges]
+        sharding.register_shards(parent_id, field, shard_ids)
+
+        header = [
+            run_command_enum_shard.s(parent_id, i, command, kwargs, start, end).set(
+                task_id=shard_id
             )
+            for i, ((start, end), shard_id) in enumerate(zip(ranges, shard_ids))
+        ]
+        chord(header, merge_enum_shards.s(field)).apply_async(task_id=parent_id)
+
+    return {"shards": len(shard_ids)}
+
+
+def shard_command(
+    command: str,
+    kwargs: dict,
+    shards: int,
+    parent_id: str | None = None,
+    producer=None,
+) -> str:
+    """Dispatches a sharded enumeration and returns the id of its merged result."""
+
+    parent_id = parent_id or uuid()
+    fanout = run_command_sharded_enum.apply_async(
+        (parent_id, command, kwargs, shards), producer=producer
+    )
+    sharding.register_children(parent_id, [fanout.id])
+    return parent_id
+
+
+@celery.task(priority=9)
+def force_cancel(task_ids: list):
+    """Kills the tasks that did not stop after their cancel flag was set."""
+
+    stuck = cancellation.pending_cancels(task_ids)
+    parent_id, *children = task_ids
+    if children:
+        # The id of a sharded run is its merge callback, it stores the
+        # CANCELLED result with what the shards found once they end
+        stuck = [task_id for task_id in stuck if task_id != parent_id]
+    if not stuck:
+        return []
+
+    celery.control.revoke(stuck, terminate=True, signal="SIGKILL")
+    # Killed tasks never reach postrun, hand their slots to waiting submissions
+    if quotas.release(task_ids[0]):
+        quotas.drain()
+    return stuck
+
+
+# Entry points a submission can be dispatched to by name
+DISPATCHERS = {
+    "run_command_ping": run_command_ping,
+    "run_command_nmap": run_command_nmap,
+    "run_command_subdomain_enum": run_command_subdomain_enum,
+    "run_command_path_enum": run_command_path_enum,
+    "parallel_nmap": parallel_nmap,
+    "shard_command": shard_command,
+}
+
+
+def dispatch(
+    task_id: str, name: str, args: list = (), kwargs: dict = None, producer=None
+):
+    """Enqueues a submission under `task_id`.
+
+    Submissions are plain data so ones waiting for a quota slot can be
+    dispatched later by whichever process frees the slot. Pass a `producer`
+    to publish many submissions over one broker connection.
+    """
 
-    return {"paths": results, "progress": 100.00}
+    target = DISPATCHERS[name]
+    if hasattr(target, "apply_async"):
+        target.apply_async(args, kwargs or {}, task_id=task_id, producer=producer)
+    else:
+        target(*args, parent_id=task_id, producer=producer, **(kwargs or {}))
@@ -0,0 +1,217 @@
+import array
+import mmap
+import os
+import re
+import struct
+import tempfile
+
+WORDLIST_DIR = os.environ.get("WORDLIST_DIR", "/usr/share/wordlists")
+INDEX_DIR = os.environ.get("WORDLIST_INDEX_DIR", os.path.join(WORDLIST_DIR, ".index"))
+CUSTOM_DIR = os.path.join(WORDLIST_DIR, "custom")
+GRIDFS_BUCKET = "wordlists"
+
+SUBDOMAIN_WORDLISTS = {
+    1: "subdomains-top1million-5000.txt",
+    2: "subdomains-top1million-20000.txt",
+    3: "subdomains-top1million-110000.txt",
+}
+
+PATH_WORDLISTS = {
+    1: "dirb-small.txt",
+    2: "dirb-common.txt",
+    3: "dirb-big.txt",
+    4: "dirbuster-medium.txt",
+    5: "dirbuster-big.txt",
+}
+
+CUSTOM_NAME = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]{0,99}$")
+
+# magic, source size, source mtime (ns), line count
+HEADER = struct.Struct("<4sQQQ")
+MAGIC = b"MWL1"
+
+
+def compile_wordlist(source: str, target: str):
+    """Writes the cleaned lines of `source` with a line offset index to `target`.
+
+    Layout: header, `count + 1` native uint64 offsets relative to the data
+    section, then the lines, each terminated by a newline.
+    """
+
+    stat = os.stat(source)
+    offsets = array.array("Q", [0])
+    data = bytearray()
+
+    with open(source, "rb") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith(b"#"):
+                continue
+            data += line + b"\n"
+            offsets.append(len(data))
+
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target))
+    with os.fdopen(fd, "wb") as f:
+        f.write(HEADER.pack(MAGIC, stat.st_size, stat.st_mtime_ns, len(offsets) - 1))
+        offsets.tofile(f)
+        f.write(data)
+
+    # Atomic, so workers compiling the same list at once do not clash
+    os.replace(tmp_path, target)
+
+
+class Wordlist:
+    """Read-only memory map of a compiled wordlist.
+
+    Pages are shared by every process mapping the same file, len() and line
+    access by index are O(1).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.source_size, self.source_mtime, self.count = HEADER.unpack_from(
+            self.mm
+        )
+        if magic != MAGIC:
+            self.mm.close()
+            raise ValueError(f"Not a compiled wordlist: {path}")
+
+        self.data_start = HEADER.size + 8 * (self.count + 1)
+        self.offsets = memoryview(self.mm)[HEADER.size : self.data_start].cast("Q")
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self.lines(*index.indices(self.count)[:2]))
+        return self.line(index % self.count if index < 0 else index)
+
+    def matches(self, stat: os.stat_result) -> bool:
+        return (self.source_size, self.source_mtime) == (
+            stat.st_size,
+            stat.st_mtime_ns,
+        )
+
+    def line(self, index: int) -> str:
+        start = self.data_start + self.offsets[index]
+        end = self.data_start + self.offsets[index + 1] - 1
+        return self.mm[start:end].decode("utf-8", errors="ignore")
+
+    def lines(self, start: int = 0, end: int | None = None):
+        end = self.count if end is None else min(end, self.count)
+        for index in range(start, end):
+            yield self.line(index)
+
+    def raw(self, start: int = 0, end: int | None = None) -> bytes:
+        """Returns lines `start` to `end` as newline separated bytes."""
+
+        end = self.count if end is None else min(end, self.count)
+        return self.mm[
+            self.data_start + self.offsets[start] : self.data_start + self.offsets[end]
+        ]
+
+    def ranges(self, shards: int) -> list[tuple[int, int]]:
+        """Splits the lines into at most `shards` contiguous ranges."""
+
+        shards = max(1, min(shards, self.count))
+        bounds = [self.count * i // shards for i in range(shards + 1)]
+        return list(zip(bounds[:-1], bounds[1:]))
+
+    def close(self):
+        self.offsets.release()
+        self.mm.close()
+
+
+# source path -> Wordlist, kept open for the lifetime of the worker process
+opened_wordlists = {}
+
+
+def index_path(source: str) -> str:
+    relative = os.path.relpath(os.path.abspath(source), WORDLIST_DIR)
+    return os.path.join(INDEX_DIR, relative.replace(os.sep, "__") + ".mwl")
+
+
+def open_wordlist(source: str) -> Wordlist:
+    """Returns the compiled form of `source`, compiling it when missing or stale."""
+
+    stat = os.stat(source)
+
+    wordlist = opened_wordlists.get(source)
+    if wordlist and wordlist.matches(stat):
+        return wordlist
+
+    target = index_path(source)
+    try:
+        wordlist = Wordlist(target)
+    except (FileNotFoundError, ValueError):
+        wordlist = None
+
+    if wordlist is None or not wordlist.matches(stat):
+        if wordlist:
+            wordlist.close()
+        compile_wordlist(source, target)
+        wordlist = Wordlist(target)
+
+    opened_wordlists[source] = wordlist
+    return wordlist
+
+
+def custom_path(name: str) -> str:
+    if not CUSTOM_NAME.match(name):
+        raise ValueError(f"Invalid wordlist name: {name}")
+    return os.path.join(CUSTOM_DIR, name)
+
+
+def fetch_custom(name: str) -> str:
+    """Downloads an uploaded wordlist from GridFS unless it is already local."""
+
+    path = custom_path(name)
+    if os.path.exists(path):
+        return path
+
+    import gridfs
+    from motegao.celery.app import get_mongo_db
+
+    bucket = gridfs.GridFSBucket(get_mongo_db(), bucket_name=GRIDFS_BUCKET)
+    os.makedirs(CUSTOM_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=CUSTOM_DIR)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            bucket.download_to_stream_by_name(name, f)
+        os.replace(tmp_path, path)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+
+    return path
+
+
+def custom_exists(name: str) -> bool:
+    import gridfs
+    from motegao.celery.app import get_mongo_db
+
+    bucket = gridfs.GridFSBucket(get_mongo_db(), bucket_name=GRIDFS_BUCKET)
+    return next(iter(bucket.find({"filename": name}, limit=1)), None) is not None
+
+
+def load(wordlists: dict, wordlist: int = 1, custom_wordlist: str | None = None):
+    """Returns the compiled builtin wordlist number `wordlist` or a custom one."""
+
+    if custom_wordlist:
+        return open_wordlist(fetch_custom(custom_wordlist))
+
+    name = wordlists.get(wordlist, wordlists[1])
+    return open_wordlist(os.path.join(WORDLIST_DIR, name))
+
+
+if __name__ == "__main__":
+    # Compile the builtin wordlists ahead of time, e.g. while building the image
+    for name in [*SUBDOMAIN_WORDLISTS.values(), *PATH_WORDLISTS.values()]:
+        source = os.path.join(WORDLIST_DIR, name)
+        if os.path.exists(source):
+            print(f"{name}: {len(open_wordlist(source))} lines")
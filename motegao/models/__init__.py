@@ -10,7 +10,8 @@ from . import files
 from .users import User
 from .tokens import ApiToken
 
-from .projects import Project
+from .projects import Project, CanvasNode, CanvasEdge
+from .scans import ScanRun, Finding
 
 DocumentType = TypeVar("DocumentType", bound=beanie.Document)
 
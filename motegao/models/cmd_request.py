@@ -1,28 +1,117 @@
+from bson import ObjectId
 from fastapi import HTTPException
+from ipaddress import ip_address
 from urllib.parse import urlparse
 from pydantic import BaseModel, Field, field_validator
-from typing import List, Optional
+from typing import Any, Dict, List, Literal, Optional
 
+from motegao.celery.engines.dns import parse_resolver
+from motegao.celery.engines.nmap import parse_targets
+from motegao.celery.wordlists import CUSTOM_NAME
 
-class NmapRequest(BaseModel):
+
+class CommandRequest(BaseModel):
+    """Options of every command that steer its submission, not the task itself."""
+
+    # Project the run and its findings are saved under
+    project_id: Optional[str] = None
+    # Skip the result cache and run the command again
+    force_refresh: bool = False
+    # Wait for a quota slot instead of failing with 429
+    wait_for_slot: bool = False
+
+    @field_validator("project_id")
+    @classmethod
+    def validate_project_id(cls, v: Optional[str]):
+        if v is not None and not ObjectId.is_valid(v):
+            raise HTTPException(
+                status_code=400,
+                detail=f"Invalid project id: {v}",
+            )
+        return v
+
+
+class EnumRequest(CommandRequest):
+    # Name of an uploaded wordlist, used instead of `wordlist`
+    custom_wordlist: Optional[str] = None
+    # > 1 splits the wordlist across that many workers
+    shards: int = Field(1, ge=1, le=64)
+
+    @field_validator("custom_wordlist")
+    @classmethod
+    def validate_custom_wordlist(cls, v: Optional[str]):
+        if v is not None and not CUSTOM_NAME.match(v):
+            raise HTTPException(
+                status_code=400,
+                detail=f"Invalid wordlist name: {v}",
+            )
+        return v
+
+
+class PingRequest(CommandRequest):
+    host: str
+
+
+class NmapRequest(CommandRequest):
     host: str
     timing_template: int = Field(3, ge=0, le=5)
     options: Optional[List[str]] = None
     all_ports: bool = False
     ports_range: Optional[List[int]] = None
     ports_specific: Optional[List[int]] = None
+    # Split hosts and ports into chunks scanned by several workers
+    parallel: bool = False
+    # Ports per chunk, defaults to a size that depends on timing_template
+    chunk_size: Optional[int] = Field(None, ge=1, le=65535)
+
+    @field_validator("host")
+    @classmethod
+    def validate_host(cls, v: str):
+        try:
+            parse_targets(v)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return v
 
 
-class subdomainEnumRequest(BaseModel):
+class subdomainEnumRequest(EnumRequest):
     domain: str = Field(..., examples=["example.com"])
     threads: int = Field(10, ge=1, le=100)
     wordlist: int = Field(1, ge=1, le=3)
+    # "native" resolves in-process over raw UDP instead of spawning gobuster
+    engine: Literal["gobuster", "native"] = "gobuster"
+    # Ceiling of lookups in flight, the native engine adapts below it
+    window: int = Field(500, ge=1, le=10000)
+    resolvers: Optional[List[str]] = Field(None, examples=[["1.1.1.1", "8.8.8.8:53"]])
+
+    @field_validator("resolvers")
+    @classmethod
+    def validate_resolvers(cls, v: Optional[List[str]]):
+        for address in v or []:
+            try:
+                host, port = parse_resolver(address)
+                ip_address(host)
+            except ValueError:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Invalid resolver address: {address}",
+                )
+            if not 0 < port < 65536:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Invalid resolver port: {address}",
+                )
+        return v
+
 
-class PathEnumRequest(BaseModel):
+class PathEnumRequest(EnumRequest):
     url: str
+    # Ceiling of requests in flight, the native engine adapts below it
     threads: int = Field(10, ge=1, le=100)
     wordlist: int = Field(1, ge=1, le=5)
     exclude_status: Optional[List[int]] = Field(default_factory=list)
+    # "native" probes in-process over pooled keep-alive connections
+    engine: Literal["gobuster", "native"] = "gobuster"
 
     @field_validator("url")
     @classmethod
@@ -49,4 +138,29 @@ class PathEnumRequest(BaseModel):
                     status_code=400,
                     detail=f"Invalid HTTP status code: {code}",
                 )
-        return v
\ No newline at end of file
+        return v
+
+
+class TaskResultsRequest(BaseModel):
+    task_ids: List[str] = Field(..., min_length=1, max_length=200)
+    # Result keys to return, e.g. ["progress"] to skip the findings while polling
+    fields: Optional[List[str]] = None
+    # Task id -> cursor of the findings already received
+    since: Optional[Dict[str, int]] = None
+    # Long-poll: hold the reply up to `wait` seconds while the etag still matches
+    wait: int = Field(0, ge=0)
+    etag: Optional[str] = None
+
+
+class BatchCommand(BaseModel):
+    command: Literal["ping", "nmap", "subdomain_enum", "path_enum"]
+    # Body of the command's own endpoint, e.g. a PathEnumRequest
+    params: Dict[str, Any]
+
+
+class BatchRequest(BaseModel):
+    commands: List[BatchCommand] = Field(..., min_length=1, max_length=500)
+    # Defaults for every command that does not set its own
+    project_id: Optional[str] = None
+    # Commands over the user's quota wait for a slot instead of failing
+    wait_for_slot: bool = True
@@ -1,6 +1,7 @@
 from beanie import Document, PydanticObjectId
 from pydantic import Field
-from typing import List
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from typing import List, Literal
 import datetime
 
 
@@ -12,6 +13,69 @@ class Project(Document):
     nodes: List[dict] = []
     edges: List[dict] = []
     lastModified: datetime.datetime = Field(default_factory=datetime.datetime.now)
+    # Bumped by every canvas save, patches must name the revision they apply to
+    revision: int = 0
+    # "split" projects keep their canvas in the canvas_nodes and canvas_edges
+    # collections, `nodes` and `edges` stay empty
+    storage: Literal["embedded", "split"] = "embedded"
+    # Set while a patch spanning several updates is applied, see patch_project
+    patching: str | None = None
+    # Summary for project listings, so they do not need the canvas. Counts
+    # follow every save, the thumbnail is refreshed by full saves.
+    node_count: int = 0
+    edge_count: int = 0
+    thumbnail: List[List[int]] = []
 
     class Settings:
         name = "projects"  # ชื่อ collection ใน MongoDB
+        indexes = [
+            IndexModel(
+                [
+                    ("owner", ASCENDING),
+                    ("lastModified", DESCENDING),
+                    ("_id", DESCENDING),
+                    # Lets listing ETags be computed from the index alone
+                    ("revision", ASCENDING),
+                ]
+            ),
+        ]
+
+
+class CanvasNode(Document):
+    """One node of a split project canvas, `data` is the whole React Flow node."""
+
+    id: PydanticObjectId | None = Field(default_factory=PydanticObjectId, alias="_id")
+    project: PydanticObjectId
+    node_id: str
+    type: str | None = None
+    # Copy of the position, for viewport queries
+    x: float = 0
+    y: float = 0
+    data: dict = {}
+
+    class Settings:
+        name = "canvas_nodes"
+        indexes = [
+            IndexModel([("project", ASCENDING), ("node_id", ASCENDING)], unique=True),
+            IndexModel([("project", ASCENDING), ("type", ASCENDING)]),
+            IndexModel([("project", ASCENDING), ("x", ASCENDING), ("y", ASCENDING)]),
+        ]
+
+
+class CanvasEdge(Document):
+    """One edge of a split project canvas, `data` is the whole React Flow edge."""
+
+    id: PydanticObjectId | None = Field(default_factory=PydanticObjectId, alias="_id")
+    project: PydanticObjectId
+    edge_id: str
+    source: str | None = None
+    target: str | None = None
+    data: dict = {}
+
+    class Settings:
+        name = "canvas_edges"
+        indexes = [
+            IndexModel([("project", ASCENDING), ("edge_id", ASCENDING)], unique=True),
+            IndexModel([("project", ASCENDING), ("source", ASCENDING)]),
+            IndexModel([("project", ASCENDING), ("target", ASCENDING)]),
+        ]
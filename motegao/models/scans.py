@@ -0,0 +1,83 @@
+from beanie import Document, Indexed, PydanticObjectId
+from pydantic import Field
+from pymongo import ASCENDING, DESCENDING, IndexModel
+import datetime
+
+
+class ScanRun(Document):
+    """One command run, written by the workers as the task progresses."""
+
+    id: PydanticObjectId | None = Field(default_factory=PydanticObjectId, alias="_id")
+    task_id: Indexed(str, unique=True)
+    # Task whose findings this run shares, for cached and coalesced requests
+    source: str | None = None
+    project: PydanticObjectId | None = None
+    owner: PydanticObjectId | None = None
+    command: str
+    target: str | None = None
+    params: dict = {}
+    status: str = "STARTED"
+    error: str | None = None
+    findings: int = 0
+    started_at: datetime.datetime = Field(default_factory=datetime.datetime.now)
+    finished_at: datetime.datetime | None = None
+
+    class Settings:
+        name = "scan_runs"
+        # Listings sort newest first on (started_at, _id)
+        indexes = [
+            IndexModel(
+                [
+                    ("project", ASCENDING),
+                    ("started_at", DESCENDING),
+                    ("_id", DESCENDING),
+                ]
+            ),
+            IndexModel(
+                [
+                    ("project", ASCENDING),
+                    ("target", ASCENDING),
+                    ("started_at", DESCENDING),
+                    ("_id", DESCENDING),
+                ]
+            ),
+        ]
+
+
+class Finding(Document):
+    """A subdomain, path or host found by a run, `key` is unique per run and kind."""
+
+    id: PydanticObjectId | None = Field(default_factory=PydanticObjectId, alias="_id")
+    run: str
+    project: PydanticObjectId | None = None
+    target: str | None = None
+    kind: str
+    key: str
+    data: dict = {}
+    discovered_at: datetime.datetime = Field(default_factory=datetime.datetime.now)
+
+    class Settings:
+        name = "findings"
+        # Listings sort newest first on (discovered_at, _id)
+        indexes = [
+            IndexModel(
+                [
+                    ("project", ASCENDING),
+                    ("discovered_at", DESCENDING),
+                    ("_id", DESCENDING),
+                ]
+            ),
+            IndexModel(
+                [
+                    ("project", ASCENDING),
+                    ("target", ASCENDING),
+                    ("kind", ASCENDING),
+                    ("discovered_at", DESCENDING),
+                    ("_id", DESCENDING),
+                ]
+            ),
+            IndexModel(
+                [("run", ASCENDING), ("kind", ASCENDING), ("key", ASCENDING)],
+                unique=True,
+            ),
+        ]